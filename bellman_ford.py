@@ -1,5 +1,4 @@
-from typing import Dict, List, Tuple
-import process_map_data as pmd
+from typing import Callable, Dict, List, Optional, Tuple
 
 
 class Graph:
@@ -42,7 +41,8 @@ class BellmanFord:
         return path[::-1]
 
 
-def bellman_ford(graph: Dict[str, List[Tuple[str, int]]], start: str, end: str) -> Tuple[List[str], int]:
+def bellman_ford(graph: Dict[str, List[Tuple[str, int]]], start: str, end: str,
+                 progress: Optional[Callable[[int, int], None]] = None) -> Tuple[List[str], int]:
     vertices = list(graph.keys())
     distances = {vertex: float('inf') for vertex in vertices}
     distances[start] = 0
@@ -50,7 +50,9 @@ def bellman_ford(graph: Dict[str, List[Tuple[str, int]]], start: str, end: str)
 
     edges = [(u, v, weight) for u, adjacent_nodes in graph.items() for v, weight in adjacent_nodes]
 
-    for _ in range(len(vertices) - 1):
+    for i in range(len(vertices) - 1):
+        if progress is not None:
+            progress(i, len(vertices) - 1)
         for u, v, weight in edges:
             if distances[u] + weight < distances[v]:
                 distances[v] = distances[u] + weight
@@ -76,6 +78,8 @@ def bellman_ford(graph: Dict[str, List[Tuple[str, int]]], start: str, end: str)
 
 
 if __name__ == "__main__":
+    import process_map_data as pmd
+
     # graph = {
     #     'A': [('B', 20), ('G', 15)],
     #     'B': [('A', 20), ('C', 8), ('D', 9)],
@@ -0,0 +1,45 @@
+import sys
+import subprocess
+import typing as tp
+
+__all__ = ['measure_import']
+
+
+MODULES = ('dijkstra', 'bellman_ford', 'floyd_warshall', 'yen', 'process_map_data',
+           'dynamic_sssp', 'isochrone', 'delta_stepping', 'tiled_region', 'polyline', 'osm_pbf')
+# dependencies that must only be loaded when a feature actually needs them
+HEAVY_MODULES = ('scipy', 'pyproj', 'networkx', 'shortestpaths', 'PySide6', 'jinja2')
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed * 1000)
+print(','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def measure_import(module: str, repeat: int = 5) -> tp.Tuple[float, tp.List[str]]:
+    """
+    Best cold import time of `module` in milliseconds over `repeat` fresh
+    interpreters, and the heavy dependencies the import pulled in.
+    """
+    best = float('inf')
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True).stdout.split('\n')
+        best = min(best, float(output[0]))
+        loaded = [name for name in output[1].split(',') if name]
+    return best, loaded
+
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 250.  # ms
+    failed = False
+    for module in MODULES:
+        elapsed, loaded = measure_import(module)
+        over = elapsed > budget or len(loaded) > 0
+        failed |= over
+        print(f"{module:<18} {elapsed:8.1f} ms  {' '.join(loaded) or '-':<24} {'FAIL' if over else 'ok'}")
+    sys.exit(1 if failed else 0)
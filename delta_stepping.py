@@ -0,0 +1,202 @@
+import typing as tp
+import numpy as np
+
+__all__ = ['delta_stepping', 'auto_delta']
+
+
+# below this many arcs per relaxation the process pool costs more than it saves
+PARALLEL_MIN_ARCS = 1 << 16
+
+# arrays of the worker processes, attached to the parent's shared memory
+_worker_arrays = {}
+_worker_memories = []
+
+
+def auto_delta(indptr: np.ndarray, weights: np.ndarray) -> float:
+    """
+    Bucket width from the weight distribution: max weight over mean out-degree
+    (the Meyer-Sanders choice, which bounds the number of light-edge phases),
+    but no narrower than the median weight so that most road segments are light.
+    """
+    if not len(weights):
+        return 1.
+    num_node = max(len(indptr) - 1, 1)
+    mean_degree = max(len(weights) / num_node, 1.)
+    return float(max(weights.max() / mean_degree, np.median(weights)))
+
+
+def split_csr(indptr: np.ndarray, targets: np.ndarray, weights: np.ndarray, mask: np.ndarray):
+    sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    counts = np.bincount(sources[mask], minlength=len(indptr) - 1)
+    return np.concatenate(([0], np.cumsum(counts))), targets[mask], weights[mask]
+
+
+def gather_arcs(indptr: np.ndarray, nodes: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+    """Arc ids leaving `nodes` and the source of each of them."""
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets, np.repeat(nodes, counts)
+
+
+def relax(distances: np.ndarray, indptr: np.ndarray, targets: np.ndarray, weights: np.ndarray,
+          nodes: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Candidate (targets, distances, sources) from `nodes` that improve on `distances`."""
+    arcs, sources = gather_arcs(indptr, nodes)
+    arc_targets = targets[arcs]
+    candidates = distances[sources] + weights[arcs]
+    better = candidates < distances[arc_targets]
+    return arc_targets[better], candidates[better], sources[better]
+
+
+def _attach_worker(specs):
+    from multiprocessing import shared_memory
+
+    for key, (name, shape, dtype) in specs.items():
+        memory = shared_memory.SharedMemory(name=name)
+        _worker_memories.append(memory)
+        _worker_arrays[key] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _relax_worker(kind: str, nodes: np.ndarray):
+    return relax(_worker_arrays['distances'], _worker_arrays[f'{kind}_indptr'],
+                 _worker_arrays[f'{kind}_targets'], _worker_arrays[f'{kind}_weights'], nodes)
+
+
+class SharedArrays:
+    """Copies arrays into shared memory so pool workers can read them without pickling."""
+
+    def __init__(self, arrays: tp.Dict[str, np.ndarray]):
+        from multiprocessing import shared_memory
+
+        self.memories = []
+        self.arrays = {}
+        self.specs = {}
+        for key, array in arrays.items():
+            memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+            shared[...] = array
+            self.memories.append(memory)
+            self.arrays[key] = shared
+            self.specs[key] = (memory.name, array.shape, array.dtype.str)
+
+    def close(self):
+        self.arrays.clear()
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories.clear()
+
+
+def delta_stepping(indptr: np.ndarray, targets: np.ndarray, weights: np.ndarray, start: int,
+                   delta: tp.Optional[float] = None, workers: int = 1,
+                   progress: tp.Optional[tp.Callable[[int, int], None]] = None) \
+        -> tp.Tuple[np.ndarray, np.ndarray]:
+    """
+    Delta-stepping single-source shortest paths over CSR arrays (see
+    OSMReader.to_csr). Nodes are kept in buckets of width `delta`; the
+    nodes of the lowest bucket relax their light edges (weight <= delta)
+    together, with NumPy, until the bucket stops changing, then relax their
+    heavy edges once. With `workers` > 1, large relaxations are split across
+    processes reading the graph and distances from shared memory.
+
+    Returns (distances, predecessors), with np.inf and -1 for unreachable nodes.
+    """
+    num_node = len(indptr) - 1
+    if delta is None:
+        delta = auto_delta(indptr, weights)
+    light = weights <= delta
+    arrays = {}
+    for kind, mask in (('light', light), ('heavy', ~light)):
+        arrays[f'{kind}_indptr'], arrays[f'{kind}_targets'], arrays[f'{kind}_weights'] = \
+            split_csr(indptr, targets, weights, mask)
+    arrays['distances'] = np.full(num_node, np.inf)
+
+    shared = None
+    pool = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        shared = SharedArrays(arrays)
+        arrays = shared.arrays
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker, initargs=(shared.specs,))
+
+    def run_relax(kind: str, nodes: np.ndarray):
+        kind_indptr = arrays[f'{kind}_indptr']
+        num_arcs = int((kind_indptr[nodes + 1] - kind_indptr[nodes]).sum())
+        if pool is None or num_arcs < PARALLEL_MIN_ARCS:
+            return relax(arrays['distances'], kind_indptr, arrays[f'{kind}_targets'],
+                         arrays[f'{kind}_weights'], nodes)
+        chunks = [chunk for chunk in np.array_split(nodes, workers) if len(chunk)]
+        results = list(pool.map(_relax_worker, [kind] * len(chunks), chunks))
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+    distances = arrays['distances']
+    predecessors = np.full(num_node, -1, dtype=np.int64)
+    settled = np.zeros(num_node, dtype=bool)
+
+    def apply(kind: str, nodes: np.ndarray) -> np.ndarray:
+        arc_targets, candidates, sources = run_relax(kind, nodes)
+        if not len(arc_targets):
+            return arc_targets
+        np.minimum.at(distances, arc_targets, candidates)
+        winners = candidates == distances[arc_targets]
+        predecessors[arc_targets[winners]] = sources[winners]
+        return np.unique(arc_targets)
+
+    try:
+        distances[start] = 0.
+        num_settled = 0
+        # reached but unsettled nodes, the only candidates for the next bucket
+        pending = np.array([start], dtype=np.int64)
+        while len(pending):
+            buckets = np.floor(distances[pending] / delta)
+            bucket = buckets.min()
+            frontier = pending[buckets == bucket]
+            removed = [frontier]
+            touched = [pending[buckets != bucket]]
+            while len(frontier):
+                improved = apply('light', frontier)
+                in_bucket = np.floor(distances[improved] / delta) == bucket
+                frontier = improved[in_bucket]
+                removed.append(frontier)
+                touched.append(improved[~in_bucket])
+            removed = np.unique(np.concatenate(removed))
+            # light edges never lead back below this bucket, heavy ones go past it
+            touched.append(apply('heavy', removed))
+            settled[removed] = True
+            pending = np.unique(np.concatenate(touched))
+            pending = pending[~settled[pending]]
+            num_settled += len(removed)
+            if progress is not None:
+                progress(num_settled, num_node)
+        return distances.copy(), predecessors
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if shared is not None:
+            shared.close()
+
+
+def get_path(predecessors: np.ndarray, start: int, end: int) -> list:
+    if end != start and predecessors[end] < 0:
+        return []
+    path = [end]
+    while path[-1] != start:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1]
+
+
+if __name__ == '__main__':
+    import dijkstra
+    import process_map_data as pmd
+
+    reader = pmd.OSMReader.parse('data/turtle_lake_map_region.osm')
+    indptr, targets, weights = reader.to_csr()
+    print("Delta: ", auto_delta(indptr, weights))
+    distances, predecessors = delta_stepping(indptr, targets, weights, start=10)
+    distance, path = dijkstra.dijkstra(reader.convert_adjacency_matrix_to_dict(), start=10, end=40)
+    assert np.isclose(distances[40], distance)
+    print("Distance: ", distances[40])
+    print("Path: ", get_path(predecessors, 10, 40))
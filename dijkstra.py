@@ -1,8 +1,10 @@
 import heapq
-import process_map_data as pmd
+import typing as tp
 
+PROGRESS_INTERVAL = 256
 
-def dijkstra(graph, start, end):
+
+def dijkstra(graph, start, end, progress: tp.Optional[tp.Callable[[int, int], None]] = None):
     queue = [(0, start, [])]  # (cost, current_node, path)
     seen = set()
     mins = {start: 0}
@@ -13,6 +15,8 @@ def dijkstra(graph, start, end):
             continue
 
         seen.add(node)
+        if progress is not None and len(seen) % PROGRESS_INTERVAL == 0:
+            progress(len(seen), len(graph))
         path = path + [node]
 
         if node == end:
@@ -31,6 +35,8 @@ def dijkstra(graph, start, end):
 
 
 if __name__ == "__main__":
+    import process_map_data as pmd
+
     # graph = {
     #     "C": [('D', 3), ('E', 2)],
     #     "E": [("D", 1), ("F", 2), ("G", 3)],
@@ -0,0 +1,150 @@
+import heapq
+import typing as tp
+import numpy as np
+import process_map_data as pmd
+
+__all__ = ['DynamicShortestPathTree']
+
+
+class DynamicShortestPathTree:
+    """
+    Single-source shortest path tree that is repaired after edge weight
+    updates instead of being recomputed.
+
+    A batch of updates is handled in two steps. Nodes whose tree path used an
+    edge that got heavier or disabled are detached (the subtree below that
+    edge) and re-seeded from their unaffected in-neighbours. Edges that got
+    lighter seed their targets directly. A Dijkstra run from those seeds then
+    only touches nodes whose distance actually changes, so the work follows
+    the size of the affected region rather than the size of the map.
+    """
+
+    def __init__(self, graph: dict, source):
+        self.source = source
+        self.version = None
+        self._out_edges = {node: dict(neighbors) for node, neighbors in graph.items()}
+        self._in_edges = {node: {} for node in self._out_edges}
+        for node, neighbors in self._out_edges.items():
+            for neighbor, weight in neighbors.items():
+                self._in_edges.setdefault(neighbor, {})[node] = weight
+                self._out_edges.setdefault(neighbor, {})
+        self.distances = {node: float('inf') for node in self._out_edges}
+        self.predecessors = {node: None for node in self._out_edges}
+        self._children = {node: set() for node in self._out_edges}
+        self.distances[source] = 0.
+        self._propagate([(0., source)])
+
+    @staticmethod
+    def from_reader(reader: pmd.OSMReader, source: int):
+        tree = DynamicShortestPathTree(reader.convert_adjacency_matrix_to_dict(), source)
+        tree.version = reader.version
+        return tree
+
+    def _set_predecessor(self, node, predecessor):
+        previous = self.predecessors[node]
+        if previous is not None:
+            self._children[previous].discard(node)
+        self.predecessors[node] = predecessor
+        if predecessor is not None:
+            self._children[predecessor].add(node)
+
+    def _propagate(self, queue: list) -> set:
+        heapq.heapify(queue)
+        changed = set()
+        while queue:
+            cost, node = heapq.heappop(queue)
+            if cost > self.distances[node]:
+                continue
+            changed.add(node)
+            for next_node, weight in self._out_edges[node].items():
+                next_cost = cost + weight
+                if next_cost < self.distances[next_node]:
+                    self.distances[next_node] = next_cost
+                    self._set_predecessor(next_node, node)
+                    heapq.heappush(queue, (next_cost, next_node))
+        return changed
+
+    def _detach_subtree(self, root) -> set:
+        subtree = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            subtree.add(node)
+            stack.extend(self._children[node])
+        for node in subtree:
+            self.distances[node] = float('inf')
+            self._set_predecessor(node, None)
+        return subtree
+
+    def apply(self, updates: tp.Iterable[pmd.EdgeUpdate], version=None) -> set:
+        """
+        Applies a batch of edge updates (as returned by OSMReader.update_edges,
+        disable_edges and enable_edges) and repairs the tree. Returns the nodes
+        whose distance or predecessor may have changed.
+        """
+        # read twice below, a generator would be empty the second time
+        updates = list(updates)
+        detached = set()
+        queue = []
+        for source, target, _, new_weight in updates:
+            if new_weight == 0:
+                self._out_edges[source].pop(target, None)
+                self._in_edges[target].pop(source, None)
+            else:
+                self._out_edges[source][target] = new_weight
+                self._in_edges[target][source] = new_weight
+            if self.predecessors[target] == source and target not in detached:
+                # the tree used this edge, its old distance may no longer hold
+                detached |= self._detach_subtree(target)
+        for node in detached:
+            for predecessor, weight in self._in_edges[node].items():
+                if predecessor in detached:
+                    continue
+                cost = self.distances[predecessor] + weight
+                if cost < self.distances[node]:
+                    self.distances[node] = cost
+                    self._set_predecessor(node, predecessor)
+            if self.distances[node] < float('inf'):
+                queue.append((self.distances[node], node))
+        for source, target, _, new_weight in updates:
+            if new_weight == 0 or target in detached:
+                continue
+            cost = self.distances[source] + new_weight
+            if cost < self.distances[target]:
+                self.distances[target] = cost
+                self._set_predecessor(target, source)
+                queue.append((cost, target))
+        if version is not None:
+            self.version = version
+        return detached | self._propagate(queue)
+
+    def shortest_path(self, target) -> tp.Tuple[float, list]:
+        distance = self.distances.get(target, float('inf'))
+        if distance == float('inf'):
+            return distance, []
+        path = [target]
+        while path[-1] != self.source:
+            path.append(self.predecessors[path[-1]])
+        return distance, path[::-1]
+
+
+if __name__ == '__main__':
+    import time
+    import dijkstra
+
+    reader = pmd.OSMReader.parse('data/turtle_lake_map_region.osm')
+    tree = DynamicShortestPathTree.from_reader(reader, source=10)
+    rng = np.random.default_rng(0)
+    sources, targets = np.nonzero(reader.adjacency_matrix)
+    picked = rng.choice(len(sources), size=5, replace=False)
+    updates = reader.update_edges(
+        (int(sources[i]), int(targets[i]), float(reader.adjacency_matrix[sources[i], targets[i]] * 3))
+        for i in picked[:3])
+    updates += reader.disable_edges((int(sources[i]), int(targets[i])) for i in picked[3:])
+    start = time.perf_counter()
+    changed = tree.apply(updates, version=reader.version)
+    print("Repair time: ", time.perf_counter() - start)
+    print("Touched nodes: ", len(changed), "of", len(reader.index_to_node))
+    distance, path = dijkstra.dijkstra(reader.convert_adjacency_matrix_to_dict(), start=10, end=40)
+    assert np.isclose(tree.shortest_path(40)[0], distance)
+    print("Distance: ", distance)
@@ -1,9 +1,9 @@
 import numpy as np
 import typing as tp
-import process_map_data as pmd
 
 
-def floyd_warshall(graph: np.ndarray, start: int, end: int) -> tp.Tuple[list, float]:
+def floyd_warshall(graph: np.ndarray, start: int, end: int,
+                   progress: tp.Optional[tp.Callable[[int, int], None]] = None) -> tp.Tuple[list, float]:
     graph[np.where(np.isclose(graph, 0.))] = np.inf
     np.fill_diagonal(graph, 0.0)
     n = graph.shape[0]
@@ -13,6 +13,8 @@ def floyd_warshall(graph: np.ndarray, start: int, end: int) -> tp.Tuple[list, fl
     queue = [s_graph.copy()]
     indices = np.arange(n)
     for k in range(n):
+        if progress is not None:
+            progress(k, n)
         current_graph = queue[-1]
         change_indices = np.where(indices != k)[0]
         row_weights = current_graph[k, change_indices]
@@ -50,6 +52,8 @@ def trace_back_shortest_path(matrix_queue: list, queue_index: int, start: int, e
 
 
 if __name__ == '__main__':
+    import process_map_data as pmd
+
     # graph = np.array([
     #     [0, 1, 0, 4],
     #     [2, 0, -2, 0],
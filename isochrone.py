@@ -0,0 +1,123 @@
+import heapq
+import typing as tp
+import numpy as np
+import dijkstra
+
+__all__ = ['bounded_dijkstra', 'isochrones', 'Isochrone']
+
+
+class Isochrone(tp.NamedTuple):
+    budget: float
+    distances: dict  # node -> distance, for every node within the budget
+    cut_points: list  # [[lat, lon], ...] where the budget runs out along an edge
+    polygon: list  # convex hull [[lat, lon], ...] of reached nodes and cut points
+
+    def to_payload(self) -> dict:
+        """JSON-ready dict for setIsochrones in map_template.html."""
+        return {'budget': float(self.budget), 'cut_points': self.cut_points, 'polygon': self.polygon}
+
+
+def bounded_dijkstra(graph, start, budget: float,
+                     progress: tp.Optional[tp.Callable[[int, int], None]] = None) -> dict:
+    """
+    Dijkstra from `start` that never settles a node further than `budget`.
+    Returns {node: distance} for the settled nodes, so the work done is bounded
+    by the reachable area rather than by the size of the graph.
+    """
+    queue = [(0., start)]
+    distances = {}
+    mins = {start: 0.}
+    while queue:
+        cost, node = heapq.heappop(queue)
+        if cost > budget:
+            break
+        if node in distances:
+            continue
+        distances[node] = cost
+        if progress is not None and len(distances) % dijkstra.PROGRESS_INTERVAL == 0:
+            progress(len(distances), len(graph))
+        for next_node, weight in graph.get(node, ()):
+            if next_node in distances:
+                continue
+            next_cost = cost + weight
+            prev = mins.get(next_node, None)
+            if next_cost <= budget and (prev is None or next_cost < prev):
+                mins[next_node] = next_cost
+                heapq.heappush(queue, (next_cost, next_node))
+    return distances
+
+
+def isochrones(graph, start, budgets: tp.Sequence[float],
+               get_coordinates: tp.Optional[tp.Callable[[list], list]] = None,
+               with_polygon: bool = True, progress=None) -> tp.List[Isochrone]:
+    """
+    Reachability for several budgets in a single bounded search up to the
+    largest budget. `get_coordinates` maps a list of nodes to [[lat, lon], ...]
+    (e.g. OSMReader.get_coordinates_from_node_indices); without it only the
+    distances are returned. Results are sorted by ascending budget, whatever
+    the order of `budgets`; no budgets give no results.
+    """
+    budgets = sorted(budgets)
+    if not budgets:
+        return []
+    distances = bounded_dijkstra(graph, start, budgets[-1], progress=progress)
+    nodes = list(distances.keys())
+    node_distances = np.array([distances[node] for node in nodes])
+    # arcs leaving the reached area, the only ones a budget can cut
+    arc_sources, arc_targets, arc_weights = [], [], []
+    for index, node in enumerate(nodes):
+        for next_node, weight in graph.get(node, ()):
+            arc_sources.append(index)
+            arc_targets.append(next_node)
+            arc_weights.append(weight)
+    arc_sources = np.array(arc_sources, dtype=np.int64)
+    arc_weights = np.array(arc_weights, dtype=float)
+    coordinates = None
+    if get_coordinates is not None:
+        coordinates = np.array(get_coordinates(nodes), dtype=float).reshape(-1, 2)
+        target_coordinates = np.array(get_coordinates(arc_targets), dtype=float).reshape(-1, 2)
+
+    results = []
+    for budget in budgets:
+        reached = node_distances <= budget
+        budget_distances = {node: distance for node, distance in zip(nodes, node_distances.tolist())
+                            if distance <= budget}
+        cut_points = []
+        polygon = []
+        if coordinates is not None:
+            source_distances = node_distances[arc_sources]
+            cut = (source_distances <= budget) & (source_distances + arc_weights > budget)
+            fractions = ((budget - source_distances[cut]) / arc_weights[cut])[:, np.newaxis]
+            start_points = coordinates[arc_sources[cut]]
+            points = start_points + (target_coordinates[cut] - start_points) * fractions
+            cut_points = points.tolist()
+            if with_polygon:
+                polygon = convex_hull(np.concatenate((coordinates[reached], points)))
+        results.append(Isochrone(budget=budget, distances=budget_distances,
+                                 cut_points=cut_points, polygon=polygon))
+    return results
+
+
+def convex_hull(points: np.ndarray) -> list:
+    import scipy.spatial as sp
+
+    if len(points) < 3:
+        return points.tolist()
+    try:
+        hull = sp.ConvexHull(points)
+    except sp.QhullError:
+        # all points on a line
+        return points.tolist()
+    return points[hull.vertices].tolist()
+
+
+if __name__ == '__main__':
+    import process_map_data as pmd
+
+    reader = pmd.OSMReader.parse('data/turtle_lake_map_region.osm')
+    graph = reader.convert_adjacency_matrix_to_dict()
+    for isochrone in isochrones(graph, start=10, budgets=[100, 250, 500],
+                                get_coordinates=reader.get_coordinates_from_node_indices):
+        print("Budget: ", isochrone.budget)
+        print("Reached nodes: ", len(isochrone.distances))
+        print("Cut points: ", len(isochrone.cut_points))
@@ -1,21 +1,24 @@
 import sys
 import typing as tp
-import scipy.spatial as sp
 import os
+import json
+import threading
 import numpy as np
 import process_map_data as pmd
+import polyline
 import dijkstra
 import bellman_ford
 import floyd_warshall
 import yen
+import isochrone
 
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QWidget, QGroupBox,
     QRadioButton, QVBoxLayout, QHBoxLayout, QFileDialog, QSizePolicy,
-    QGraphicsSimpleTextItem, QDialog
+    QGraphicsSimpleTextItem, QDialog, QProgressBar, QMessageBox, QGraphicsPixmapItem
 )
-from PySide6.QtCore import QPointF, QObject, Signal, Qt, QUrl
-from PySide6.QtGui import QPainter, QBrush, QPen, QFont, QColor
+from PySide6.QtCore import QPointF, QLineF, QRectF, QObject, Signal, Qt, QUrl, QRunnable, QThreadPool, QTimer
+from PySide6.QtGui import QPainter, QPixmap, QBrush, QPen, QFont, QColor
 from PySide6.QtWebEngineWidgets import QWebEngineView
 from PySide6.QtCharts import QChartView, QChart, QLineSeries, QScatterSeries
 from jinja2 import Environment, FileSystemLoader
@@ -24,6 +27,7 @@ from jinja2 import Environment, FileSystemLoader
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 env = Environment(loader=FileSystemLoader(CURRENT_DIR))
 TEMPLATE = env.get_template('map_template.html')
+ISOCHRONE_BUDGETS = (250., 500., 1000.)  # meters
 
 
 class WebEngineView(QWidget):
@@ -31,12 +35,31 @@ class WebEngineView(QWidget):
         super().__init__(parent)
         layout = QHBoxLayout()
         self._browser = QWebEngineView(self)
+        self._browser.loadFinished.connect(self.on_load_finished)
+        self._loaded = False
+        self._pending_scripts = []
         layout.addWidget(self._browser)
         self.setLayout(layout)
 
     def set_html_content(self, html: str):
+        self._loaded = False
+        self._pending_scripts.clear()
         self._browser.setHtml(html)
 
+    def run_javascript(self, script: str):
+        # scripts sent before the page has loaded are replayed once it has
+        if self._loaded:
+            self._browser.page().runJavaScript(script)
+        else:
+            self._pending_scripts.append(script)
+
+    def on_load_finished(self, ok: bool):
+        self._loaded = ok
+        if ok:
+            for script in self._pending_scripts:
+                self._browser.page().runJavaScript(script)
+            self._pending_scripts.clear()
+
     def load(self, url: str):
         self._browser.load(QUrl(url))
 
@@ -45,14 +68,124 @@ class ScatterCommunicator(QObject):
     node_clicked_signal = Signal(int)
 
 
+class RoutingCancelled(Exception):
+    pass
+
+
+class RoutingCommunicator(QObject):
+    progress_signal = Signal(int, int, int)  # job id, done, total
+    finished_signal = Signal(int, list, list)  # job id, paths, distances
+    failed_signal = Signal(int, str)  # job id, message
+
+
+class RoutingWorker(QRunnable):
+    """
+    Runs one routing job on a QThreadPool thread. The algorithm reports
+    progress through `report_progress`, which is also where a cancelled job
+    stops: it raises RoutingCancelled out of the search loop.
+    """
+
+    def __init__(self, job_id: int, function: tp.Callable, communicator: RoutingCommunicator):
+        super().__init__()
+        self.setAutoDelete(False)
+        self._job_id = job_id
+        self._function = function
+        self._communicator = communicator
+        self._cancelled = threading.Event()
+        self._last_percent = -1
+
+    @property
+    def job_id(self) -> int:
+        return self._job_id
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def report_progress(self, done: int, total: int):
+        if self._cancelled.is_set():
+            raise RoutingCancelled()
+        percent = int(100 * done / total) if total else 0
+        if percent != self._last_percent:
+            self._last_percent = percent
+            self._communicator.progress_signal.emit(self._job_id, done, total)
+
+    def run(self):
+        try:
+            paths, distances = self._function(self.report_progress)
+        except RoutingCancelled:
+            return
+        except Exception as e:
+            if not self._cancelled.is_set():
+                self._communicator.failed_signal.emit(self._job_id, str(e) or type(e).__name__)
+            return
+        if not self._cancelled.is_set():
+            self._communicator.finished_signal.emit(self._job_id, list(paths), list(distances))
+
+
+class ZoomableChartView(QChartView):
+    def wheelEvent(self, event):
+        if self.chart() is None:
+            return
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        self.chart().zoom(factor)
+        event.accept()
+
+    def mouseDoubleClickEvent(self, event):
+        if self.chart() is not None:
+            self.chart().zoomReset()
+        super().mouseDoubleClickEvent(event)
+
+
+class SegmentItem(QGraphicsPixmapItem):
+    """
+    Line segments rendered into a pixmap with a single drawLines call per
+    pen. The pixmap is redrawn when the view changes only, repaints (e.g.
+    while hovering nodes) just blit it.
+    """
+
+    def __init__(self, pens: tp.List[QPen], parent=None):
+        super().__init__(parent)
+        self._pens = pens
+
+    def set_lines(self, rect: QRectF, lines: tp.List[tp.List[QLineF]], device_pixel_ratio: float = 1.):
+        pixmap = QPixmap((rect.size() * device_pixel_ratio).toSize())
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.translate(-rect.topLeft())
+        for pen, pen_lines in zip(self._pens, lines):
+            if pen_lines:
+                painter.setPen(pen)
+                painter.drawLines(pen_lines)
+        painter.end()
+        self.setPixmap(pixmap)
+        self.setOffset(rect.topLeft())
+
+
 class ChartView(QWidget):
-    def __init__(self, title=None, parent=None):
+    """
+    Road network chart. With `lod` enabled, road segments are drawn by one
+    SegmentItem instead of one QLineSeries per edge. Only segments inside the
+    visible axis range are drawn, snapped to whole pixels, and segments
+    collapsing to a single pixel or duplicating another one are dropped, so
+    the drawn geometry gets coarser as the view zooms out. Node markers are
+    culled the same way and thinned to one per marker-sized cell; zooming in
+    brings back the hidden ones. Zooming and resizing schedule one deferred
+    update, however many range signals they fire.
+    """
+
+    def __init__(self, title=None, parent=None, lod=True):
         super().__init__(parent)
         self._title = title
+        self._lod = lod
         self._scatter_series = QScatterSeries()
         self._scatter_series.setMarkerSize(5)
         self._scatter_series.hovered.connect(self.on_hovered)
-        self._chart_view = QChartView()
+        self._chart_view = ZoomableChartView()
         self._chart_view.setRenderHint(QPainter.RenderHint.Antialiasing)
         #
         layout = QHBoxLayout()
@@ -68,50 +201,183 @@ class ChartView(QWidget):
         self._kdtree = None
         self._highlighted_series = None
         self._labels = []
-        self._selected_series = QScatterSeries()
+        self._selected_series = None
         self._node_infos = None
+        self._segments = None
+        self._segment_pens = []
+        self._segment_pen_indices = None
+        self._segment_item = None
+        self._scatter_points = None
+        self._update_timer = QTimer(self)
+        self._update_timer.setSingleShot(True)
+        self._update_timer.setInterval(0)
+        self._update_timer.timeout.connect(self.update_view)
 
     def plot(self, points: np.ndarray, color_map: tp.Union[dict, None] = None):
-        assert points.shape[1] == 2
+        assert points.shape[-1] == 2
+        color_map = color_map or {}
         self._chart = QChart()
         self._chart.legend().hide()
         if self._title is not None:
             self._chart.setTitle(self._title)
         #
-        for idx, nodes in enumerate(points):
-            line_series = QLineSeries()
-            if idx in color_map:
-                color = color_map[idx]
-                pen = QPen(QColor.fromRgb(*color))
-                pen.setWidth(3)
-                line_series.setPen(pen)
-            for point in nodes:
-                line_series.append(*point)
-            self._chart.addSeries(line_series)
+        if self._lod:
+            self._plot_segments(points, color_map)
+        else:
+            for idx, nodes in enumerate(points):
+                line_series = QLineSeries()
+                if idx in color_map:
+                    color = color_map[idx]
+                    pen = QPen(QColor.fromRgb(*color))
+                    pen.setWidth(3)
+                    line_series.setPen(pen)
+                for point in nodes:
+                    line_series.append(*point)
+                self._chart.addSeries(line_series)
         self._chart.createDefaultAxes()
         self._chart.axes()[0].hide()
         self._chart.axes()[1].hide()
+        self._create_overlay_series()
         self._chart_view.setChart(self._chart)
+        if self._lod:
+            for axis in self._chart.axes():
+                axis.rangeChanged.connect(self.schedule_update)
+            self._chart.plotAreaChanged.connect(self.schedule_update)
+            self.update_view()
+
+    def _plot_segments(self, points: np.ndarray, color_map: dict):
+        self._segments = np.asarray(points, dtype=float).reshape(-1, 4)
+        self._segment_pens = [QPen(QColor.fromRgb(32, 159, 223))]
+        self._segment_pen_indices = np.zeros(len(self._segments), dtype=np.int64)
+        color_to_pen_index = {}
+        for idx, color in color_map.items():
+            if color not in color_to_pen_index:
+                pen = QPen(QColor.fromRgb(*color))
+                pen.setWidth(3)
+                color_to_pen_index[color] = len(self._segment_pens)
+                self._segment_pens.append(pen)
+            self._segment_pen_indices[idx] = color_to_pen_index[color]
+        # road segments sit above the plot background and below the series
+        self._segment_item = SegmentItem(self._segment_pens, self._chart)
+        self._segment_item.setZValue(1)
+        # an invisible series spanning the map gives the axes their extent
+        extent_series = QLineSeries()
+        extent_series.append(self._segments[:, [0, 2]].min(), self._segments[:, [1, 3]].min())
+        extent_series.append(self._segments[:, [0, 2]].max(), self._segments[:, [1, 3]].max())
+        extent_series.setVisible(False)
+        self._chart.addSeries(extent_series)
+
+    def _create_overlay_series(self):
+        self._highlighted_series = QScatterSeries()
+        self._highlighted_series.clicked.connect(self.on_node_clicked)
+        self._highlighted_series.setMarkerSize(10)
+        self._highlighted_series.setBrush(QBrush(Qt.GlobalColor.yellow))
+        self._highlighted_series.setPen(QPen(Qt.GlobalColor.black))
+        self._selected_series = QScatterSeries()
+        self._selected_series.setMarkerSize(10)
+        self._selected_series.setBrush(QBrush(Qt.GlobalColor.green))
+        self._selected_series.setPen(QPen(Qt.GlobalColor.black))
+        for series in (self._selected_series, self._highlighted_series):
+            self._chart.addSeries(series)
+            self._attach_axes(series)
+
+    def _attach_axes(self, series):
+        for axis in self._chart.axes():
+            series.attachAxis(axis)
+
+    def schedule_update(self, *args):
+        self._update_timer.start()
+
+    def _visible_range(self):
+        axis_x, axis_y = self._chart.axes(Qt.Orientation.Horizontal)[0], self._chart.axes(Qt.Orientation.Vertical)[0]
+        x_min, x_max = axis_x.min(), axis_x.max()
+        y_min, y_max = axis_y.min(), axis_y.max()
+        plot_area = self._chart.plotArea()
+        if x_max <= x_min or y_max <= y_min or plot_area.isEmpty():
+            return None
+        return plot_area, x_min, x_max, y_min, y_max
+
+    def update_view(self):
+        if self._chart is None:
+            return
+        visible_range = self._visible_range()
+        if visible_range is None:
+            return
+        self.update_segments(*visible_range)
+        self.update_nodes(*visible_range)
+        for label, point in self._labels:
+            pos = self._chart.mapToPosition(point, self._scatter_series)
+            label.setPos(pos.x(), pos.y())
+
+    def update_segments(self, plot_area, x_min: float, x_max: float, y_min: float, y_max: float):
+        if self._segments is None:
+            return
+        segments = self._segments
+        # cull segments whose bounding box misses the visible range
+        visible = ((np.maximum(segments[:, 0], segments[:, 2]) >= x_min)
+                   & (np.minimum(segments[:, 0], segments[:, 2]) <= x_max)
+                   & (np.maximum(segments[:, 1], segments[:, 3]) >= y_min)
+                   & (np.minimum(segments[:, 1], segments[:, 3]) <= y_max))
+        segments = segments[visible]
+        pen_indices = self._segment_pen_indices[visible]
+        # data -> chart coordinates, snapped to whole pixels
+        scale_x = plot_area.width() / (x_max - x_min)
+        scale_y = plot_area.height() / (y_max - y_min)
+        pixels = np.empty_like(segments)
+        pixels[:, [0, 2]] = np.rint(plot_area.left() + (segments[:, [0, 2]] - x_min) * scale_x)
+        pixels[:, [1, 3]] = np.rint(plot_area.bottom() - (segments[:, [1, 3]] - y_min) * scale_y)
+        keep = (pixels[:, 0] != pixels[:, 2]) | (pixels[:, 1] != pixels[:, 3])
+        pixels = pixels[keep]
+        pen_indices = pen_indices[keep]
+        lines = []
+        for pen_index in range(len(self._segment_pens)):
+            pen_pixels = np.unique(pixels[pen_indices == pen_index], axis=0)
+            lines.append([QLineF(*line) for line in pen_pixels.tolist()])
+        self._segment_item.set_lines(plot_area, lines, self._chart_view.devicePixelRatioF())
+
+    def update_nodes(self, plot_area, x_min: float, x_max: float, y_min: float, y_max: float):
+        if self._scatter_points is None:
+            return
+        points = self._scatter_points
+        indices = np.flatnonzero((points[:, 0] >= x_min) & (points[:, 0] <= x_max)
+                                 & (points[:, 1] >= y_min) & (points[:, 1] <= y_max))
+        # one marker per marker-sized cell, the first node falling in it
+        cell = self._scatter_series.markerSize()
+        cells = np.column_stack((
+            np.floor((points[indices, 0] - x_min) * plot_area.width() / (x_max - x_min) / cell),
+            np.floor((points[indices, 1] - y_min) * plot_area.height() / (y_max - y_min) / cell)))
+        _, first = np.unique(cells, axis=0, return_index=True)
+        indices = indices[np.sort(first)]
+        self._scatter_series.replace([QPointF(*point) for point in points[indices].tolist()])
 
     def scatter(self, points: np.ndarray, node_infos=None):
+        import scipy.spatial as sp
+
         assert points.shape[1] == 2
         if self._points is None:
             self._points = points
         self._kdtree = sp.KDTree(points)
-        for index, point in enumerate(points):
-            self._scatter_series.append(*point)
         self._chart.addSeries(self._scatter_series)
+        self._attach_axes(self._scatter_series)
+        if self._lod:
+            self._scatter_points = np.asarray(points, dtype=float)
+            self.update_view()
+        else:
+            self._scatter_series.replace([QPointF(*point) for point in points.tolist()])
+        # keep the interactive overlays above the nodes
+        for series in (self._selected_series, self._highlighted_series):
+            self._chart.removeSeries(series)
+            self._chart.addSeries(series)
+            self._attach_axes(series)
         self._node_infos = node_infos
 
     def on_node_clicked(self, point: QPointF):
         if self._kdtree is None:
             return
-        if self._selected_series:
-            if len(self._selected_series.points()) == 2:
-                self._chart.removeSeries(self._selected_series)
-                self._selected_series = QScatterSeries()
+        if len(self._selected_series.points()) == 2:
+            self._selected_series.clear()
         if len(self._labels) >= 2:
-            for label in self._labels:
+            for label, _ in self._labels:
                 self._chart.scene().removeItem(label)
             self._labels.clear()
         x = point.x()
@@ -124,42 +390,35 @@ class ChartView(QWidget):
         font.setPointSize(13)
         label.setFont(font)
         label.setBrush(QBrush(Qt.GlobalColor.black))
-        self._labels.append(label)
+        self._labels.append((label, QPointF(point)))
         pos = self._chart.mapToPosition(point, self._scatter_series)
         label.setPos(pos.x(), pos.y())
         self._chart.scene().addItem(label)
-        self._selected_series.setMarkerSize(10)
-        self._selected_series.setBrush(QBrush(Qt.GlobalColor.green))
-        self._selected_series.setPen(QPen(Qt.GlobalColor.black))
-        self._chart.addSeries(self._selected_series)
-        self._chart.createDefaultAxes()
-        self._chart.axes()[0].hide()
-        self._chart.axes()[1].hide()
         self.nodeClicked.emit(node_index)
 
-    def on_hovered(self, point: QPointF):
-        if self._highlighted_series:
-            self._chart.removeSeries(self._highlighted_series)
-        self._highlighted_series = QScatterSeries()
-        self._highlighted_series.clicked.connect(self.on_node_clicked)
-        self._highlighted_series.append(point)
-        self._highlighted_series.setMarkerSize(10)
-        self._highlighted_series.setBrush(QBrush(Qt.GlobalColor.yellow))
-        self._highlighted_series.setPen(QPen(Qt.GlobalColor.black))
-        self._chart.addSeries(self._highlighted_series)
-        self._chart.createDefaultAxes()
-        self._chart.axes()[0].hide()
-        self._chart.axes()[1].hide()
+    def on_hovered(self, point: QPointF, state: bool = True):
+        if self._highlighted_series is None:
+            return
+        if state:
+            self._highlighted_series.replace([point])
 
     def reset(self):
+        self._update_timer.stop()
+        if self._chart is not None and self._scatter_series.chart() is self._chart:
+            self._chart.removeSeries(self._scatter_series)
         self._scatter_series.clear()
         self._chart = None
         self._points = None
         self._kdtree = None
         self._highlighted_series = None
         self._labels = []
-        self._selected_series.clear()
+        self._selected_series = None
         self._node_infos = None
+        self._segments = None
+        self._segment_pens = []
+        self._segment_pen_indices = None
+        self._segment_item = None
+        self._scatter_points = None
 
 
 class OnlineMapDialog(QDialog):
@@ -173,10 +432,10 @@ class OnlineMapDialog(QDialog):
         self.setWindowTitle('Online Map')
         self.setMinimumSize(720, 480)
 
-    def find_best_way(self, start_loc: list, end_loc: list):
+    def find_best_way(self, start_loc: list, end_loc: list, engine: str = 'graphhopper_foot'):
         # Generate a URL to display the route using OpenStreetMap
         route_url = (f"https://www.openstreetmap.org/directions?"
-                     f"engine=graphhopper_foot"
+                     f"engine={engine}"
                      f"&route={start_loc[0]}%2C{start_loc[1]}%3B{end_loc[0]}%2C{end_loc[1]}")
         self._web_view.load(route_url)
 
@@ -187,6 +446,17 @@ class Application(QMainWindow):
         self.setWindowTitle("OpenStreetMap with Path")
         self.reader = None
         self.index_to_marker_positions = {}
+        self.thread_pool = QThreadPool.globalInstance()
+        self.routing_communicator = RoutingCommunicator()
+        self.routing_communicator.progress_signal.connect(self.on_routing_progress)
+        self.routing_communicator.finished_signal.connect(self.on_routing_finished)
+        self.routing_communicator.failed_signal.connect(self.on_routing_failed)
+        self.isochrone_communicator = RoutingCommunicator()
+        self.isochrone_communicator.progress_signal.connect(self.on_routing_progress)
+        self.isochrone_communicator.finished_signal.connect(self.on_isochrones_finished)
+        self.isochrone_communicator.failed_signal.connect(self.on_routing_failed)
+        self.routing_worker = None
+        self.routing_job_id = 0
         #
         widget = QWidget()
         layout = QVBoxLayout(widget)
@@ -208,6 +478,18 @@ class Application(QMainWindow):
         algorithm_selection_layout.addWidget(self.bellman_radio_btn)
         algorithm_selection_layout.addWidget(self.floyd_radio_btn)
         algorithm_selection_layout.addWidget(self.yen_radio_btn)
+        profile_group_box = QGroupBox()
+        profile_group_box.setTitle('Profiles')
+        profile_group_box.setSizePolicy(
+            QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Fixed)
+        profile_selection_layout = QHBoxLayout(profile_group_box)
+        self.car_radio_btn = QRadioButton(self)
+        self.car_radio_btn.setText('Car (one-way streets)')
+        self.car_radio_btn.setChecked(True)
+        self.foot_radio_btn = QRadioButton(self)
+        self.foot_radio_btn.setText('Foot')
+        profile_selection_layout.addWidget(self.car_radio_btn)
+        profile_selection_layout.addWidget(self.foot_radio_btn)
         # chart and web view
         chart_and_web_widget = QWidget()
         self.chart_view = ChartView(title='Graph', parent=self)
@@ -223,13 +505,29 @@ class Application(QMainWindow):
         open_osm_btn.clicked.connect(self.load_osm_file)
         find_routes_btn = QPushButton('Find Routes', self)
         find_routes_btn.clicked.connect(self.run_shortest_path_algorithm)
+        reachable_area_btn = QPushButton('Show Reachable Area', self)
+        reachable_area_btn.clicked.connect(self.run_isochrone_algorithm)
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.cancel_btn = QPushButton('Cancel', self)
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_shortest_path_algorithm)
+        progress_widget = QWidget()
+        progress_layout = QHBoxLayout(progress_widget)
+        progress_layout.setContentsMargins(0, 0, 0, 0)
+        progress_layout.addWidget(self.progress_bar, 1)
+        progress_layout.addWidget(self.cancel_btn)
         verify_result_btn = QPushButton('Find Routes with Online Map', self)
         verify_result_btn.clicked.connect(self.open_online_map_dialog)
         # add widgets
         layout.addWidget(chart_and_web_widget)
         layout.addWidget(algorithm_group_box)
+        layout.addWidget(profile_group_box)
         layout.addWidget(open_osm_btn)
         layout.addWidget(find_routes_btn)
+        layout.addWidget(reachable_area_btn)
+        layout.addWidget(progress_widget)
         layout.addWidget(verify_result_btn)
         self.setCentralWidget(widget)
         self.showMaximized()
@@ -238,30 +536,91 @@ class Application(QMainWindow):
         if self.reader is None or len(self.index_to_marker_positions) != 2:
             return
         if self.dijkstra_radio_btn.isChecked():
-            shortest_paths, distances = self.run_dijkstra_algorithm()
+            algorithm = self.run_dijkstra_algorithm
         elif self.bellman_radio_btn.isChecked():
-            shortest_paths, distances = self.run_bellman_ford_algorithm()
+            algorithm = self.run_bellman_ford_algorithm
         elif self.floyd_radio_btn.isChecked():
-            shortest_paths, distances = self.run_floyd_warshall_algorithm()
+            algorithm = self.run_floyd_warshall_algorithm
         elif self.yen_radio_btn.isChecked():
-            shortest_paths, distances = self.run_yen_algorithm()
+            algorithm = self.run_yen_algorithm
         else:
             assert False
 
-        bounds = self.reader.get_array_bounds()
-        view = [(bounds[0][0] + bounds[1][0]) / 2,
-                (bounds[0][1] + bounds[1][1]) / 2]
-        output_html = TEMPLATE.render(
-            view=view, bounds=bounds,
-            mark_positions=list(self.index_to_marker_positions.values()),
-            paths=shortest_paths, distances=distances)
-        self.web_view.set_html_content(output_html)
+        self.cancel_shortest_path_algorithm()
+        # capture the query on the UI thread so later clicks cannot change it
+        reader = self.reader
+        start_index, end_index = list(self.index_to_marker_positions.keys())
+        profile = self.selected_profile()
+        self.routing_job_id += 1
+        self.routing_worker = RoutingWorker(
+            job_id=self.routing_job_id,
+            function=lambda progress: self.encode_routes(*algorithm(reader, start_index, end_index, profile, progress)),
+            communicator=self.routing_communicator)
+        self.progress_bar.setValue(0)
+        self.cancel_btn.setEnabled(True)
+        self.thread_pool.start(self.routing_worker)
+
+    def run_isochrone_algorithm(self):
+        # reachable area from the first selected node
+        if self.reader is None or not len(self.index_to_marker_positions):
+            return
+        self.cancel_shortest_path_algorithm()
+        reader = self.reader
+        start_index = next(iter(self.index_to_marker_positions))
+        profile = self.selected_profile()
+        self.routing_job_id += 1
+        self.routing_worker = RoutingWorker(
+            job_id=self.routing_job_id,
+            function=lambda progress: self.run_isochrones(reader, start_index, profile, progress),
+            communicator=self.isochrone_communicator)
+        self.progress_bar.setValue(0)
+        self.cancel_btn.setEnabled(True)
+        self.thread_pool.start(self.routing_worker)
+
+    def cancel_shortest_path_algorithm(self):
+        if self.routing_worker is not None:
+            self.routing_worker.cancel()
+            self.routing_worker = None
+        self.progress_bar.setValue(0)
+        self.cancel_btn.setEnabled(False)
+
+    def is_current_routing_job(self, job_id: int) -> bool:
+        return self.routing_worker is not None and self.routing_worker.job_id == job_id
+
+    def on_routing_progress(self, job_id: int, done: int, total: int):
+        if self.is_current_routing_job(job_id) and total:
+            self.progress_bar.setValue(int(100 * done / total))
+
+    def on_routing_failed(self, job_id: int, message: str):
+        if self.is_current_routing_job(job_id):
+            self.routing_worker = None
+            self.progress_bar.setValue(0)
+            self.cancel_btn.setEnabled(False)
+            QMessageBox.warning(self, 'Routing failed', message)
+
+    def on_routing_finished(self, job_id: int, shortest_paths: list, distances: list):
+        if not self.is_current_routing_job(job_id):
+            return
+        self.routing_worker = None
+        self.progress_bar.setValue(100)
+        self.cancel_btn.setEnabled(False)
+        self.web_view.run_javascript(
+            f'setRoutes({json.dumps(shortest_paths)}, {json.dumps([float(d) for d in distances])});')
+
+    def on_isochrones_finished(self, job_id: int, payloads: list, budgets: list):
+        if not self.is_current_routing_job(job_id):
+            return
+        self.routing_worker = None
+        self.progress_bar.setValue(100)
+        self.cancel_btn.setEnabled(False)
+        self.web_view.run_javascript(f'setIsochrones({json.dumps(payloads)});')
 
     def load_osm_file(self):
+        self.cancel_shortest_path_algorithm()
         if self.reader is not None:
             self.chart_view.reset()
         filepath = QFileDialog.getOpenFileName(
-            self, "Open File", CURRENT_DIR, "OSM file (*.osm)")
+            self, "Open File", CURRENT_DIR, "OSM file (*.osm *.pbf *.osm.gz *.osm.bz2 *.osm.xz)")
         if os.path.isfile(filepath[0]):
             self.reader = pmd.OSMReader.parse(filepath[0])
             line_coordinates, line_idx_to_color = self.reader.get_line_coordinates(return_colors=True)
@@ -279,6 +638,7 @@ class Application(QMainWindow):
             self.web_view.set_html_content(output_html)
 
     def render_web_ui(self, node_index):
+        self.cancel_shortest_path_algorithm()
         if self.reader is not None:
             node = self.reader.index_to_node[node_index]
             if len(self.index_to_marker_positions) == 2:
@@ -286,52 +646,64 @@ class Application(QMainWindow):
             self.index_to_marker_positions[node_index] = [
                 node.raw_lat, node.raw_lon]
             #
-            bounds = self.reader.get_array_bounds()
-            view = [(bounds[0][0] + bounds[1][0]) / 2,
-                    (bounds[0][1] + bounds[1][1]) / 2]
-            output_html = TEMPLATE.render(
-                view=view, bounds=bounds,
-                mark_positions=list(self.index_to_marker_positions.values()))
-            self.web_view.set_html_content(output_html)
+            self.web_view.run_javascript(
+                f'clearRoutes(); clearIsochrones(); setMarkers({json.dumps(list(self.index_to_marker_positions.values()))});')
 
     def open_online_map_dialog(self):
         dialog = OnlineMapDialog(self)
         marker_locations = list(self.index_to_marker_positions.values())
+        engine = 'graphhopper_car' if self.selected_profile() == 'car' else 'graphhopper_foot'
         dialog.find_best_way(
-            start_loc=marker_locations[0], end_loc=marker_locations[1])
+            start_loc=marker_locations[0], end_loc=marker_locations[1], engine=engine)
         dialog.show()
 
-    def run_dijkstra_algorithm(self) -> tp.Tuple[list, list]:
-        assert self.reader is not None
-        graph = self.reader.convert_adjacency_matrix_to_dict()
-        start_index, end_index = list(self.index_to_marker_positions.keys())
+    def selected_profile(self) -> str:
+        return 'foot' if self.foot_radio_btn.isChecked() else 'car'
+
+    @staticmethod
+    def encode_routes(shortest_paths: list, distances: list) -> tp.Tuple[list, list]:
+        # runs on the worker thread, only the encoded polylines reach the page
+        return [polyline.encode_levels(path) for path in shortest_paths], distances
+
+    @staticmethod
+    def run_isochrones(reader, start_index, profile=None, progress=None) -> tp.Tuple[list, list]:
+        graph = reader.convert_adjacency_matrix_to_dict(profile)
+        results = isochrone.isochrones(
+            graph, start_index, ISOCHRONE_BUDGETS,
+            get_coordinates=reader.get_coordinates_from_node_indices, progress=progress)
+        return [result.to_payload() for result in results], [result.budget for result in results]
+
+    @staticmethod
+    def run_dijkstra_algorithm(reader, start_index, end_index, profile=None, progress=None) \
+            -> tp.Tuple[list, list]:
+        graph = reader.convert_adjacency_matrix_to_dict(profile)
         distance, path = dijkstra.dijkstra(
-            graph=graph, start=start_index, end=end_index)
-        return [self.reader.get_coordinates_from_node_indices(path)], [distance]
+            graph=graph, start=start_index, end=end_index, progress=progress)
+        return [reader.get_coordinates_from_node_indices(path)], [distance]
 
-    def run_bellman_ford_algorithm(self) -> tp.Tuple[list, list]:
-        assert self.reader is not None
-        graph = self.reader.convert_adjacency_matrix_to_dict()
-        start_index, end_index = list(self.index_to_marker_positions.keys())
+    @staticmethod
+    def run_bellman_ford_algorithm(reader, start_index, end_index, profile=None, progress=None) \
+            -> tp.Tuple[list, list]:
+        graph = reader.convert_adjacency_matrix_to_dict(profile)
         path, distance = bellman_ford.bellman_ford(
-            graph=graph, start=start_index, end=end_index)
-        print(path)
-        return [self.reader.get_coordinates_from_node_indices(path)], [distance]
+            graph=graph, start=start_index, end=end_index, progress=progress)
+        return [reader.get_coordinates_from_node_indices(path)], [distance]
 
-    def run_floyd_warshall_algorithm(self) -> tp.Tuple[list, list]:
-        assert self.reader is not None
-        start_index, end_index = list(self.index_to_marker_positions.keys())
+    @staticmethod
+    def run_floyd_warshall_algorithm(reader, start_index, end_index, profile=None, progress=None) \
+            -> tp.Tuple[list, list]:
+        # floyd_warshall rewrites the matrix it is given, keep the reader's intact
         path, distance = floyd_warshall.floyd_warshall(
-            graph=self.reader.adjacency_matrix, start=start_index, end=end_index)
-        return [self.reader.get_coordinates_from_node_indices(path)], [distance]
+            graph=reader.get_adjacency_matrix(profile).copy(), start=start_index, end=end_index, progress=progress)
+        return [reader.get_coordinates_from_node_indices(path)], [distance]
 
-    def run_yen_algorithm(self) -> tp.Tuple[list, list]:
-        assert self.reader is not None
-        graph = self.reader.convert_adjacency_matrix_to_dict()
-        start_index, end_index = list(self.index_to_marker_positions.keys())
+    @staticmethod
+    def run_yen_algorithm(reader, start_index, end_index, profile=None, progress=None) \
+            -> tp.Tuple[list, list]:
+        graph = reader.convert_adjacency_matrix_to_dict(profile)
         paths, distances = yen.yen(
-            graph=graph, source=start_index, target=end_index)
-        return [self.reader.get_coordinates_from_node_indices(path) for path in paths], distances
+            graph=graph, source=start_index, target=end_index, progress=progress)
+        return [reader.get_coordinates_from_node_indices(path) for path in paths], distances
 
 
 if __name__ == "__main__":
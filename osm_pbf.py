@@ -0,0 +1,268 @@
+import zlib
+import collections
+import typing as tp
+import numpy as np
+
+__all__ = ['read', 'read_bounds', 'OSMBlock']
+
+
+# features of the OSM PBF format this reader understands
+SUPPORTED_FEATURES = ('OsmSchema-V0.6', 'DenseNodes')
+
+
+class OSMBlock(tp.NamedTuple):
+    """Nodes and ways of a primitive block, or of a whole file."""
+    node_ids: np.ndarray
+    node_lat: np.ndarray  # degrees
+    node_lon: np.ndarray  # degrees
+    way_ids: np.ndarray
+    way_refs: np.ndarray  # node ids of all ways, back to back
+    way_lengths: np.ndarray  # number of refs of each way
+    way_tags: list
+    bounds: tp.Union[dict, None] = None
+
+
+def read_varint(data, pos: int) -> tp.Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def iter_fields(data):
+    """(field number, value) of a protobuf message. Length-delimited values are memoryviews."""
+    data = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value = data[pos:pos + 8]
+            pos += 8
+        elif wire_type == 5:
+            value = data[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f'Unsupported protobuf wire type {wire_type}')
+        yield key >> 3, value
+
+
+def zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def signed(value: int) -> int:
+    # int64 varints carry negative values in two's complement
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def decode_packed(values: list) -> np.ndarray:
+    """
+    Unsigned values of a repeated varint field, given the parts it came in:
+    packed (a memoryview of back to back varints) or single varints.
+    """
+    arrays = []
+    for value in values:
+        if isinstance(value, int):
+            arrays.append(np.array([value], dtype=np.uint64))
+            continue
+        raw = np.frombuffer(value, dtype=np.uint8)
+        if not len(raw):
+            continue
+        assert raw[-1] < 0x80, 'Truncated packed varints'
+        ends = np.flatnonzero(raw < 0x80)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        shifts = 7 * (np.arange(len(raw)) - np.repeat(starts, ends - starts + 1))
+        # the 7-bit groups do not overlap, so summing them is or-ing them
+        arrays.append(np.add.reduceat((raw & 0x7f).astype(np.uint64) << shifts.astype(np.uint64), starts))
+    return np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint64)
+
+
+def decode_zigzag(values: list) -> np.ndarray:
+    values = decode_packed(values)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def decompress_blob(blob) -> bytes:
+    for field, value in iter_fields(blob):
+        if field == 1:
+            return bytes(value)
+        if field == 3:
+            return zlib.decompress(value)
+        if field == 4:
+            import lzma
+            return lzma.decompress(value)
+    raise ValueError('Unsupported blob compression')
+
+
+def decode_header(data) -> tp.Union[dict, None]:
+    bounds = None
+    for field, value in iter_fields(data):
+        if field == 1:
+            box = {field: zigzag(value) / 1e9 for field, value in iter_fields(value)}
+            # same keys and string values as the bounds element of OSM XML
+            bounds = {'minlat': str(box[4]), 'minlon': str(box[1]),
+                      'maxlat': str(box[3]), 'maxlon': str(box[2])}
+        elif field == 4:
+            feature = bytes(value).decode('utf-8')
+            assert feature in SUPPORTED_FEATURES, f'Unsupported OSM PBF feature {feature}'
+    return bounds
+
+
+def decode_primitive_block(data) -> OSMBlock:
+    strings = []
+    groups = []
+    granularity = 100
+    lat_offset = 0
+    lon_offset = 0
+    for field, value in iter_fields(data):
+        if field == 1:
+            strings = [bytes(string).decode('utf-8') for key, string in iter_fields(value) if key == 1]
+        elif field == 2:
+            groups.append(value)
+        elif field == 17:
+            granularity = value
+        elif field == 19:
+            lat_offset = signed(value)
+        elif field == 20:
+            lon_offset = signed(value)
+
+    node_ids, node_lat, node_lon = [], [], []
+    way_ids, way_refs, way_lengths, way_tags = [], [], [], []
+    for group in groups:
+        for field, value in iter_fields(group):
+            if field == 1:
+                # plain node, deltas do not apply
+                node = dict(iter_fields(value))
+                node_ids.append(np.array([zigzag(node[1])]))
+                node_lat.append(np.array([zigzag(node[8])]))
+                node_lon.append(np.array([zigzag(node[9])]))
+            elif field == 2:
+                dense = collections.defaultdict(list)
+                for key, part in iter_fields(value):
+                    dense[key].append(part)
+                node_ids.append(np.cumsum(decode_zigzag(dense[1])))
+                node_lat.append(np.cumsum(decode_zigzag(dense[8])))
+                node_lon.append(np.cumsum(decode_zigzag(dense[9])))
+            elif field == 3:
+                way = collections.defaultdict(list)
+                for key, part in iter_fields(value):
+                    way[key].append(part)
+                refs = np.cumsum(decode_zigzag(way[8]))
+                way_ids.append(signed(way[1][0]))
+                way_refs.append(refs)
+                way_lengths.append(len(refs))
+                way_tags.append({strings[key]: strings[val] for key, val in zip(
+                    decode_packed(way[2]).tolist(), decode_packed(way[3]).tolist())})
+
+    def coordinates(values: list, offset: int) -> np.ndarray:
+        values = np.concatenate(values) if values else np.empty(0, dtype=np.int64)
+        # exact nanodegrees divided once, so 7-decimal coordinates read as in OSM XML
+        return (offset + granularity * values) / 1e9
+
+    return OSMBlock(
+        node_ids=np.concatenate(node_ids) if node_ids else np.empty(0, dtype=np.int64),
+        node_lat=coordinates(node_lat, lat_offset), node_lon=coordinates(node_lon, lon_offset),
+        way_ids=np.array(way_ids, dtype=np.int64),
+        way_refs=np.concatenate(way_refs) if way_refs else np.empty(0, dtype=np.int64),
+        way_lengths=np.array(way_lengths, dtype=np.int64), way_tags=way_tags)
+
+
+def decode_blob(kind: str, blob: bytes) -> tp.Union[dict, OSMBlock, None]:
+    """Header bounds of an OSMHeader blob, or the nodes and ways of an OSMData blob."""
+    data = decompress_blob(blob)
+    if kind == 'OSMHeader':
+        return decode_header(data)
+    return decode_primitive_block(data)
+
+
+def iter_blobs(f) -> tp.Iterator[tp.Tuple[str, bytes]]:
+    while True:
+        size = f.read(4)
+        if not size:
+            return
+        header = f.read(int.from_bytes(size, 'big'))
+        kind = None
+        data_size = 0
+        for field, value in iter_fields(header):
+            if field == 1:
+                kind = bytes(value).decode('utf-8')
+            elif field == 3:
+                data_size = value
+        blob = f.read(data_size)
+        # unknown blob types are to be skipped
+        if kind in ('OSMHeader', 'OSMData'):
+            yield kind, blob
+
+
+def read_bounds(filename: str) -> tp.Union[dict, None]:
+    with open(filename, 'rb') as f:
+        for kind, blob in iter_blobs(f):
+            if kind == 'OSMHeader':
+                return decode_blob(kind, blob)
+    return None
+
+
+def read(filename: str, workers: int = 1) -> OSMBlock:
+    """
+    Reads an .osm.pbf file. Blobs are read one after the other and
+    decompressed and decoded independently, so with `workers` > 1 they are
+    decoded by a process pool while the file is still being read; at most a
+    few blobs per worker wait in memory.
+    """
+    with open(filename, 'rb') as f:
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = []
+                pending = collections.deque()
+                for kind, blob in iter_blobs(f):
+                    pending.append(pool.submit(decode_blob, kind, blob))
+                    if len(pending) >= 4 * workers:
+                        results.append(pending.popleft().result())
+                results.extend(future.result() for future in pending)
+        else:
+            results = [decode_blob(kind, blob) for kind, blob in iter_blobs(f)]
+
+    bounds = None
+    blocks = []
+    for result in results:
+        if isinstance(result, OSMBlock):
+            blocks.append(result)
+        elif result is not None:
+            bounds = result
+    if not blocks:
+        blocks.append(decode_primitive_block(b''))
+    return OSMBlock(
+        node_ids=np.concatenate([block.node_ids for block in blocks]),
+        node_lat=np.concatenate([block.node_lat for block in blocks]),
+        node_lon=np.concatenate([block.node_lon for block in blocks]),
+        way_ids=np.concatenate([block.way_ids for block in blocks]),
+        way_refs=np.concatenate([block.way_refs for block in blocks]),
+        way_lengths=np.concatenate([block.way_lengths for block in blocks]),
+        way_tags=[tags for block in blocks for tags in block.way_tags],
+        bounds=bounds)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    start = time.perf_counter()
+    data = read(sys.argv[1], workers=int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    print("Read time: ", time.perf_counter() - start)
+    print("Bounds: ", data.bounds)
+    print("Number of nodes: ", len(data.node_ids))
+    print("Number of ways: ", len(data.way_ids))
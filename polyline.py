@@ -0,0 +1,94 @@
+import typing as tp
+import numpy as np
+
+__all__ = ['encode', 'decode', 'simplify', 'encode_levels']
+
+
+R = 6371 * 1000  # Earth's radius in meters
+# meters per pixel of a 256px web mercator tile at zoom 0 on the equator
+METERS_PER_PIXEL_ZOOM_0 = 156543.03392
+ZOOM_LEVELS = (10, 12, 14, 16)
+
+
+def encode(coordinates: tp.Union[list, np.ndarray], precision: int = 5) -> str:
+    """Encodes [[lat, lon], ...] with the Google encoded polyline algorithm."""
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    if not len(coordinates):
+        return ''
+    values = np.rint(coordinates * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chunks = []
+    for value in ((deltas << 1) ^ (deltas >> 63)).tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def decode(encoded: str, precision: int = 5) -> tp.List[tp.List[float]]:
+    values = []
+    value = 0
+    shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = 0
+            shift = 0
+    coordinates = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0)
+    return (coordinates / 10 ** precision).tolist()
+
+
+def simplify(coordinates: tp.Union[list, np.ndarray], tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of [[lat, lon], ...] with a tolerance in
+    meters. The end points are always kept.
+    """
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    if len(coordinates) < 3 or tolerance <= 0:
+        return coordinates
+    # local equirectangular frame in meters
+    lat0 = np.radians(coordinates[:, 0].mean())
+    points = np.radians(coordinates) * R
+    points[:, 1] *= np.cos(lat0)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start = points[first]
+        direction = points[last] - start
+        offsets = points[first + 1:last] - start
+        length = np.hypot(*direction)
+        if length > 0:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        else:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return coordinates[keep]
+
+
+def encode_levels(coordinates: tp.Union[list, np.ndarray],
+                  zoom_levels: tp.Sequence[int] = ZOOM_LEVELS) -> tp.Dict[str, str]:
+    """
+    Encodes a route once per zoom level, simplified to about one pixel at
+    that zoom, plus the full geometry under the key 'full'.
+    """
+    coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    levels = {'full': encode(coordinates)}
+    if not len(coordinates):
+        return levels
+    meters_per_pixel = METERS_PER_PIXEL_ZOOM_0 * np.cos(np.radians(coordinates[:, 0].mean()))
+    for zoom in zoom_levels:
+        levels[str(zoom)] = encode(simplify(coordinates, meters_per_pixel / 2 ** zoom))
+    return levels
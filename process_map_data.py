@@ -1,15 +1,35 @@
+import bz2
+import gzip
+import lzma
+import pickle
 import typing as tp
 import numpy as np
-import pyproj
-import networkx as nx
 
 from xml.etree import ElementTree
 
-__all__ = ['OSMReader']
+__all__ = ['OSMReader', 'SpatialIndex', 'WeightProfile', 'NodeStore', 'EdgeStore', 'Ways', 'OSMData',
+           'open_osm', 'OSM_EXTENSIONS']
 
 
 R = 6371 * 1000  # Earth's radius in kilometers
-TRANSFORMER = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:3857")
+OSM_EXTENSIONS = ('.osm', '.pbf', '.osm.gz', '.osm.bz2', '.osm.xz')
+_transformer = None
+
+
+# pyproj and scipy are imported on first use, so importing this module
+# (e.g. to search a cached graph) costs only numpy
+def get_transformer():
+    global _transformer
+    if _transformer is None:
+        import pyproj
+        _transformer = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:3857")
+    return _transformer
+
+
+def __getattr__(name):
+    if name == 'TRANSFORMER':
+        return get_transformer()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 class Node(tp.NamedTuple):
@@ -21,7 +41,7 @@ class Node(tp.NamedTuple):
 
     # Function to convert latitude and longitude to Cartesian coordinates
     def to_cartesian(self):
-        x, y = TRANSFORMER.transform(self.raw_lat, self.raw_lon)
+        x, y = get_transformer().transform(self.raw_lat, self.raw_lon)
         return x, y, 0
 
     def __eq__(self, other):
@@ -34,51 +54,537 @@ class Edge(tp.NamedTuple):
     name: str
     is_oneway: bool
     merged_length: tp.Union[float, None] = None
-
-    def merge_with(self, other):
-        if self == other:
-            return self
-        assert self.nodes[1] == other.nodes[0]
-        assert self.is_oneway is other.is_oneway
-        return Edge(
-            id=self.id, nodes=(self.nodes[0], other.nodes[1]),
-            name=self.name, is_oneway=self.is_oneway,
-            merged_length=self.distance() + other.distance())
+    tags: tp.Union[dict, None] = None
 
     def distance(self) -> float:
         node1, node2 = self.nodes
-        lat1 = node1.lat
-        lat2 = node2.lat
-        lon1 = node1.lon
-        lon2 = node2.lon
-        delta_lat = abs(lat2 - lat1)
-        delta_lon = abs(lon2 - lon1)
-        a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
-        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-        d = R * c
-        return d
+        return haversine(node1.lat, node1.lon, node2.lat, node2.lon)
 
     def __eq__(self, other):
         return self.id == other.id and self.nodes == other.nodes
 
 
-class EdgeGroup(tp.NamedTuple):
-    edges: tp.List[Edge]
+def haversine(lat1, lon1, lat2, lon2):
+    # coordinates in radians, works element-wise on arrays
+    delta_lat = np.abs(lat2 - lat1)
+    delta_lon = np.abs(lon2 - lon1)
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    d = R * c
+    return d
+
+
+class NodeStore:
+    """
+    Nodes as parallel arrays. Indexing and iterating give Node views that are
+    created on demand, so callers written against a list of Node keep working.
+    """
+
+    def __init__(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray):
+        # lat, lon in degrees
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.raw_lat = np.asarray(lat, dtype=float)
+        self.raw_lon = np.asarray(lon, dtype=float)
+        self.lat = np.radians(self.raw_lat)
+        self.lon = np.radians(self.raw_lon)
+        self._sorted = np.argsort(self.ids, kind='stable')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index) -> tp.Union[Node, 'NodeStore']:
+        if isinstance(index, (slice, list, np.ndarray)):
+            # slices and index arrays select a sub-store, like slicing a list gives a list
+            return self.take(np.arange(len(self))[index])
+        return Node(id=int(self.ids[index]), lon=float(self.lon[index]), lat=float(self.lat[index]),
+                    raw_lon=float(self.raw_lon[index]), raw_lat=float(self.raw_lat[index]))
+
+    def __iter__(self) -> tp.Iterator[Node]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def find(self, ids: tp.Union[list, np.ndarray]) -> np.ndarray:
+        """Indices of the given node ids, -1 for unknown ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(ids.shape, -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, ids, sorter=self._sorted), len(self.ids) - 1)
+        indices = self._sorted[positions]
+        return np.where(self.ids[indices] == ids, indices, -1)
+
+    def take(self, indices: np.ndarray):
+        return NodeStore(self.ids[indices], self.raw_lat[indices], self.raw_lon[indices])
+
+    def get_cartesian_coordinates(self) -> np.ndarray:
+        x, y = get_transformer().transform(self.raw_lat, self.raw_lon)
+        return np.column_stack((x, y))
+
+
+class EdgeStore:
+    """
+    Edges as node index pairs into a NodeStore plus per-edge flags and
+    lengths. Way attributes (id, tags) are stored once per way. Indexing and
+    iterating give Edge views created on demand.
+    """
+
+    def __init__(self, nodes: NodeStore, node_indices: np.ndarray, lengths: np.ndarray,
+                 is_merged: np.ndarray, way_indices: np.ndarray, way_ids: np.ndarray,
+                 way_is_oneway: np.ndarray, way_tags: tp.List[dict]):
+        self.nodes = nodes
+        self.node_indices = np.asarray(node_indices, dtype=np.int64).reshape(-1, 2)
+        self.lengths = np.asarray(lengths, dtype=float)
+        self.is_merged = np.asarray(is_merged, dtype=bool)
+        self.way_indices = np.asarray(way_indices, dtype=np.int64)
+        self.way_ids = np.asarray(way_ids, dtype=np.int64)
+        self.way_is_oneway = np.asarray(way_is_oneway, dtype=bool)
+        self.way_tags = way_tags
+
+    @property
+    def is_oneway(self) -> np.ndarray:
+        return self.way_is_oneway[self.way_indices]
+
+    def __len__(self):
+        return len(self.node_indices)
+
+    def __getitem__(self, index) -> tp.Union[Edge, 'EdgeStore']:
+        if isinstance(index, (slice, list, np.ndarray)):
+            return self.take(np.arange(len(self))[index], self.nodes, np.arange(len(self.nodes)))
+        way_index = self.way_indices[index]
+        tags = self.way_tags[way_index]
+        return Edge(
+            id=str(self.way_ids[way_index]),
+            nodes=(self.nodes[self.node_indices[index, 0]], self.nodes[self.node_indices[index, 1]]),
+            name=tags.get('name', ''), is_oneway=bool(self.way_is_oneway[way_index]),
+            merged_length=float(self.lengths[index]) if self.is_merged[index] else None, tags=tags)
+
+    def __iter__(self) -> tp.Iterator[Edge]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def take(self, indices: np.ndarray, nodes: NodeStore, node_index_map: np.ndarray):
+        """Subset of the edges, re-pointed at `nodes` through `node_index_map`."""
+        return EdgeStore(
+            nodes=nodes, node_indices=node_index_map[self.node_indices[indices]],
+            lengths=self.lengths[indices], is_merged=self.is_merged[indices],
+            way_indices=self.way_indices[indices], way_ids=self.way_ids,
+            way_is_oneway=self.way_is_oneway, way_tags=self.way_tags)
+
+
+class WaySegments(tp.NamedTuple):
+    # consecutive node pairs of every way, in way order
+    node_indices: np.ndarray
+    way_indices: np.ndarray
+    way_ids: np.ndarray
+    way_is_oneway: np.ndarray
+    way_tags: tp.List[dict]
+
+
+class Ways(tp.NamedTuple):
+    ids: np.ndarray
+    refs: np.ndarray  # node ids of all ways, back to back
+    lengths: np.ndarray  # number of refs of each way
+    tags: tp.List[dict]
+
+    def ref_way_indices(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.lengths)), self.lengths)
+
+    def is_routable(self) -> np.ndarray:
+        # at least one segment, and not a self-loop (e.g. a building outline)
+        ends = np.cumsum(self.lengths)
+        routable = self.lengths > 1
+        routable[routable] = self.refs[ends[routable] - self.lengths[routable]] != self.refs[ends[routable] - 1]
+        return routable
+
+    def is_oneway(self) -> np.ndarray:
+        return np.array([tags.get('oneway') == 'yes' for tags in self.tags], dtype=bool)
+
+
+class OSMData(tp.NamedTuple):
+    nodes: NodeStore
+    ways: Ways
+    bounds: tp.Union[dict, None]
+
+
+def open_osm(filename: str):
+    """Binary stream of an OSM XML file, decompressed on the fly when it is compressed."""
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    if filename.endswith('.bz2'):
+        return bz2.open(filename, 'rb')
+    if filename.endswith('.xz'):
+        return lzma.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def iter_elements(source) -> tp.Iterator[ElementTree.Element]:
+    """
+    Top-level elements (bounds, node, way, ...) of an OSM XML stream. Each one
+    is dropped from the tree once the next is read, so memory does not grow
+    with the file.
+    """
+    root = None
+    depth = 0
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield element
+            root.clear()
+
+
+class EdgeSnap(tp.NamedTuple):
+    edge_index: np.ndarray
+    fraction: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    distance: np.ndarray
+
+
+def to_unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    # lat, lon in radians -> points on the unit sphere
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_meters(chord: np.ndarray) -> np.ndarray:
+    return 2 * R * np.arcsin(np.clip(chord / 2, 0., 1.))
+
+
+class SpatialIndex:
+    """
+    Snaps (lat, lon) coordinates in degrees to the nearest graph node or
+    to the nearest point on an edge.
+
+    Nodes are indexed as points on the unit sphere, so nearest neighbours
+    are exact great-circle neighbours. Edges are sampled every
+    `sample_spacing` meters and the `k` nearest samples give the candidate
+    edges that are then projected onto exactly.
+    """
+
+    def __init__(self, node_lat: np.ndarray, node_lon: np.ndarray, edge_node_indices: np.ndarray,
+                 sample_spacing: float = 25., chunk_size: int = 1 << 18):
+        import scipy.spatial as sp
+
+        self.node_lat = np.asarray(node_lat, dtype=float)
+        self.node_lon = np.asarray(node_lon, dtype=float)
+        self.edge_node_indices = np.asarray(edge_node_indices, dtype=np.int64).reshape(-1, 2)
+        self.sample_spacing = sample_spacing
+        self.chunk_size = chunk_size
+        self.node_tree = sp.cKDTree(to_unit_vectors(self.node_lat, self.node_lon))
+        self.sample_edge_indices, sample_points = self._sample_edges()
+        self.edge_tree = sp.cKDTree(sample_points) if len(sample_points) else None
+
+    def _sample_edges(self) -> tp.Tuple[np.ndarray, np.ndarray]:
+        start = to_unit_vectors(self.node_lat[self.edge_node_indices[:, 0]],
+                                self.node_lon[self.edge_node_indices[:, 0]])
+        end = to_unit_vectors(self.node_lat[self.edge_node_indices[:, 1]],
+                              self.node_lon[self.edge_node_indices[:, 1]])
+        lengths = chord_to_meters(np.linalg.norm(end - start, axis=1))
+        num_samples = np.maximum(np.ceil(lengths / self.sample_spacing).astype(np.int64), 1) + 1
+        edge_indices = np.repeat(np.arange(len(num_samples)), num_samples)
+        offsets = np.arange(len(edge_indices)) - np.repeat(np.cumsum(num_samples) - num_samples, num_samples)
+        t = (offsets / np.repeat(num_samples - 1, num_samples))[:, np.newaxis]
+        # points along the chord are close enough to the sphere at road scale
+        points = start[edge_indices] * (1 - t) + end[edge_indices] * t
+        return edge_indices, points
+
+    def _chunks(self, lat: np.ndarray, lon: np.ndarray):
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        assert lat.shape == lon.shape
+        for begin in range(0, len(lat), self.chunk_size):
+            end = begin + self.chunk_size
+            yield np.radians(lat[begin:end]), np.radians(lon[begin:end])
+
+    def nearest_nodes(self, lat: np.ndarray, lon: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+        """Returns (node indices, distances in meters) for each query point."""
+        indices = []
+        distances = []
+        for lat_chunk, lon_chunk in self._chunks(lat, lon):
+            chord, index = self.node_tree.query(to_unit_vectors(lat_chunk, lon_chunk), k=1)
+            indices.append(index)
+            distances.append(chord_to_meters(chord))
+        if not indices:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(indices), np.concatenate(distances)
+
+    def nearest_edges(self, lat: np.ndarray, lon: np.ndarray, k: int = 16) -> EdgeSnap:
+        """
+        Returns the nearest point on an edge for each query point. `fraction`
+        is the position of that point along the edge, from its first node (0)
+        to its second node (1).
+        """
+        assert self.edge_tree is not None, 'Graph has no edges'
+        k = min(k, self.edge_tree.n)
+        results = []
+        for lat_chunk, lon_chunk in self._chunks(lat, lon):
+            _, sample_indices = self.edge_tree.query(to_unit_vectors(lat_chunk, lon_chunk), k=k)
+            candidates = self.sample_edge_indices[sample_indices.reshape(len(lat_chunk), k)]
+            results.append(self._project(lat_chunk, lon_chunk, candidates))
+        if not results:
+            empty = np.empty(0)
+            return EdgeSnap(np.empty(0, dtype=np.int64), empty, empty, empty, empty)
+        return EdgeSnap(*(np.concatenate(arrays) for arrays in zip(*results)))
+
+    def _project(self, lat: np.ndarray, lon: np.ndarray, candidates: np.ndarray) -> EdgeSnap:
+        # local equirectangular frame around every query point, in meters
+        lat0 = lat[:, np.newaxis]
+        lon0 = lon[:, np.newaxis]
+        scale = np.cos(lat0)
+        nodes = self.edge_node_indices[candidates]
+        ax = (self.node_lon[nodes[..., 0]] - lon0) * scale * R
+        ay = (self.node_lat[nodes[..., 0]] - lat0) * R
+        bx = (self.node_lon[nodes[..., 1]] - lon0) * scale * R
+        by = (self.node_lat[nodes[..., 1]] - lat0) * R
+        dx = bx - ax
+        dy = by - ay
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(length2 > 0, -(ax * dx + ay * dy) / length2, 0.)
+        t = np.clip(t, 0., 1.)
+        px = ax + t * dx
+        py = ay + t * dy
+        distances = np.hypot(px, py)
+        best = np.argmin(distances, axis=1)
+        rows = np.arange(len(lat))
+        px = px[rows, best]
+        py = py[rows, best]
+        snap_lat = lat + py / R
+        snap_lon = lon + px / (scale[:, 0] * R)
+        return EdgeSnap(
+            edge_index=candidates[rows, best], fraction=t[rows, best],
+            lat=np.degrees(snap_lat), lon=np.degrees(snap_lon),
+            distance=distances[rows, best])
+
+
+class WeightProfile(tp.NamedTuple):
+    """
+    Turns edge lengths into arc weights. `tag_costs` maps (tag key, tag
+    value) pairs to length multipliers, with value None matching any value of
+    the key; an infinite multiplier forbids the edge.
+    """
+    name: str
+    respect_oneway: bool = True
+    tag_costs: tp.Union[dict, None] = None
 
-    @staticmethod
-    def merge_edges(edges: tp.List[Edge]):
-        new_edge = edges[0]
-        for edge in edges:
-            new_edge = new_edge.merge_with(edge)
-        return new_edge
+    def tags_multiplier(self, tags: dict) -> float:
+        multiplier = 1.
+        if self.tag_costs and tags:
+            for key, value in tags.items():
+                multiplier *= self.tag_costs.get((key, value), self.tag_costs.get((key, None), 1.))
+        return multiplier
+
+    def weights(self, edges: EdgeStore, arc_edge_indices: np.ndarray,
+                arc_is_forward: np.ndarray, arc_lengths: np.ndarray) -> np.ndarray:
+        # tags live on ways, so the multipliers are computed once per way
+        way_multipliers = np.array([self.tags_multiplier(tags) for tags in edges.way_tags], dtype=float)
+        weights = arc_lengths.copy()
+        if len(arc_edge_indices):
+            weights *= way_multipliers[edges.way_indices[arc_edge_indices]]
+        if self.respect_oneway:
+            weights[~arc_is_forward & edges.is_oneway[arc_edge_indices]] = np.inf
+        return weights
+
+
+CAR_PROFILE = WeightProfile(name='car')
+FOOT_PROFILE = WeightProfile(name='foot', respect_oneway=False)
+
+
+class EdgeUpdate(tp.NamedTuple):
+    source: int
+    target: int
+    old_weight: float  # 0. means no edge, as in the adjacency matrix
+    new_weight: float
 
 
 class OSMReader:
-    def __init__(self, edges, adjacency_matrix, index_to_node, bounds):
+    """
+    The road graph. Its topology is a list of arcs, a forward and a backward
+    arc per edge, shared by every weight profile; a profile only adds one
+    weight array over those arcs (np.inf where the profile forbids the arc).
+    `adjacency_matrix` and `convert_adjacency_matrix_to_dict` give the active
+    profile's view of the graph, with 0 meaning no edge as before.
+    """
+
+    def __init__(self, edges: EdgeStore, index_to_node: NodeStore, bounds,
+                 profiles: tp.Sequence[WeightProfile] = (CAR_PROFILE, FOOT_PROFILE)):
         self.edges = edges
         self.index_to_node = index_to_node
-        self.adjacency_matrix = adjacency_matrix
         self.bounds = bounds
+        self.version = 0
+        self._build_arcs()
+        self.profiles = {}
+        self.profile_weights = {}
+        for profile in profiles:
+            self.add_profile(profile)
+        self.profile = profiles[0].name
+        self._disabled_weights = {}  # profile name -> {arc index: weight}
+        self._pair_to_arcs = None
+        self._adjacency_matrix_cache = None
+        self._spatial_index = None
+
+    def _build_arcs(self):
+        edge_node_indices = self.edges.node_indices
+        num_edge = len(self.edges)
+        self.arc_sources = np.concatenate((edge_node_indices[:, 0], edge_node_indices[:, 1]))
+        self.arc_targets = np.concatenate((edge_node_indices[:, 1], edge_node_indices[:, 0]))
+        self.arc_edge_indices = np.tile(np.arange(num_edge), 2)
+        self.arc_is_forward = np.arange(2 * num_edge) < num_edge
+        self.arc_lengths = np.tile(self.edges.lengths, 2)
+
+    def add_profile(self, profile: WeightProfile):
+        self.profiles[profile.name] = profile
+        self.profile_weights[profile.name] = profile.weights(
+            self.edges, self.arc_edge_indices, self.arc_is_forward, self.arc_lengths)
+
+    def set_profile(self, name: str):
+        assert name in self.profile_weights, f'Unknown profile {name}'
+        self.profile = name
+
+    def get_adjacency_matrix(self, profile: tp.Union[str, None] = None) -> np.ndarray:
+        profile = profile or self.profile
+        cache = self._adjacency_matrix_cache
+        if cache is not None and cache[0] == (profile, self.version):
+            return cache[1]
+        weights = self.profile_weights[profile]
+        num_node = len(self.index_to_node)
+        adjacency_matrix = np.zeros((num_node, num_node))
+        finite = np.flatnonzero(np.isfinite(weights))
+        # write the heaviest parallel arcs first so the lightest one is kept
+        finite = finite[np.argsort(-weights[finite], kind='stable')]
+        adjacency_matrix[self.arc_sources[finite], self.arc_targets[finite]] = weights[finite]
+        self._adjacency_matrix_cache = ((profile, self.version), adjacency_matrix)
+        return adjacency_matrix
+
+    @property
+    def adjacency_matrix(self) -> np.ndarray:
+        return self.get_adjacency_matrix()
+
+    def to_csr(self, profile: tp.Union[str, None] = None) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(indptr, targets, weights) of the active profile's arcs, grouped by source node."""
+        weights = self.profile_weights[profile or self.profile]
+        finite = np.flatnonzero(np.isfinite(weights))
+        finite = finite[np.argsort(self.arc_sources[finite], kind='stable')]
+        counts = np.bincount(self.arc_sources[finite], minlength=len(self.index_to_node))
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return indptr, self.arc_targets[finite], weights[finite]
+
+    def _arcs_between(self, source: int, target: int) -> tp.List[int]:
+        if self._pair_to_arcs is None:
+            self._pair_to_arcs = {}
+            for arc, pair in enumerate(zip(self.arc_sources.tolist(), self.arc_targets.tolist())):
+                self._pair_to_arcs.setdefault(pair, []).append(arc)
+        return self._pair_to_arcs.get((source, target), [])
+
+    def _pair_weight(self, source: int, target: int) -> float:
+        weights = self.profile_weights[self.profile]
+        arc_weights = [weights[arc] for arc in self._arcs_between(source, target)]
+        weight = min(arc_weights, default=np.inf)
+        return 0. if np.isinf(weight) else float(weight)
+
+    def update_edges(self, updates: tp.Iterable[tp.Tuple[int, int, float]]) -> tp.List[EdgeUpdate]:
+        """
+        Sets the weights of existing directed edges (source index, target index,
+        weight) of the active profile in place. A disabled edge gets its new
+        weight but stays disabled until `enable_edges` is called. Bumps
+        `version` once for the batch. The whole batch is checked first, so a
+        bad update raises (ValueError for a weight, KeyError for a missing
+        edge) before any weight is changed.
+        """
+        weights = self.profile_weights[self.profile]
+        disabled = self._disabled_weights.get(self.profile, {})
+        batch = []
+        for source, target, weight in updates:
+            if not 0 < weight < np.inf:
+                raise ValueError(f'Invalid weight {weight} from {source} to {target}, '
+                                 f'use disable_edges to remove an edge')
+            arcs = [arc for arc in self._arcs_between(source, target)
+                    if arc in disabled or np.isfinite(weights[arc])]
+            if not arcs:
+                raise KeyError(f'No edge from {source} to {target}')
+            batch.append((source, target, weight, arcs))
+        disabled = self._disabled_weights.setdefault(self.profile, disabled)
+        changes = []
+        for source, target, weight, arcs in batch:
+            old_weight = self._pair_weight(source, target)
+            for arc in arcs:
+                if arc in disabled:
+                    disabled[arc] = weight
+                else:
+                    weights[arc] = weight
+            new_weight = self._pair_weight(source, target)
+            if old_weight != new_weight:
+                changes.append(EdgeUpdate(source, target, old_weight, new_weight))
+        self.version += 1
+        return changes
+
+    def disable_edges(self, pairs: tp.Iterable[tp.Tuple[int, int]]) -> tp.List[EdgeUpdate]:
+        weights = self.profile_weights[self.profile]
+        disabled = self._disabled_weights.setdefault(self.profile, {})
+        changes = []
+        for source, target in pairs:
+            old_weight = self._pair_weight(source, target)
+            if old_weight == 0:
+                continue
+            for arc in self._arcs_between(source, target):
+                if np.isfinite(weights[arc]):
+                    disabled[arc] = weights[arc]
+                    weights[arc] = np.inf
+            changes.append(EdgeUpdate(source, target, old_weight, 0.))
+        self.version += 1
+        return changes
+
+    def enable_edges(self, pairs: tp.Iterable[tp.Tuple[int, int]]) -> tp.List[EdgeUpdate]:
+        weights = self.profile_weights[self.profile]
+        disabled = self._disabled_weights.setdefault(self.profile, {})
+        changes = []
+        for source, target in pairs:
+            old_weight = self._pair_weight(source, target)
+            for arc in self._arcs_between(source, target):
+                if arc in disabled:
+                    weights[arc] = disabled.pop(arc)
+            new_weight = self._pair_weight(source, target)
+            if old_weight != new_weight:
+                changes.append(EdgeUpdate(source, target, old_weight, new_weight))
+        self.version += 1
+        return changes
+
+    @property
+    def spatial_index(self) -> SpatialIndex:
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(
+                node_lat=self.index_to_node.lat, node_lon=self.index_to_node.lon,
+                edge_node_indices=self.edges.node_indices)
+        return self._spatial_index
+
+    def snap_to_nodes(self, lat, lon) -> tp.Tuple[np.ndarray, np.ndarray]:
+        return self.spatial_index.nearest_nodes(lat, lon)
+
+    def snap_to_edges(self, lat, lon, k: int = 16) -> EdgeSnap:
+        return self.spatial_index.nearest_edges(lat, lon, k=k)
+
+    def save(self, filename: str, with_spatial_index: bool = True):
+        if with_spatial_index:
+            _ = self.spatial_index
+        state = self.__dict__.copy()
+        state['_pair_to_arcs'] = None
+        state['_adjacency_matrix_cache'] = None
+        if not with_spatial_index:
+            state['_spatial_index'] = None
+        with open(filename, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(filename: str):
+        with open(filename, 'rb') as f:
+            state = pickle.load(f)
+        reader = OSMReader.__new__(OSMReader)
+        reader.__dict__.update(state)
+        return reader
 
     @staticmethod
     def is_oneway_edge(element) -> bool:
@@ -92,181 +598,199 @@ class OSMReader:
         return is_oneway
 
     @staticmethod
-    def parse_node(root) -> tp.Tuple[dict, dict]:
-        id_to_node = {}
+    def collect(elements: tp.Iterable[ElementTree.Element]) -> OSMData:
+        """Nodes, ways and bounds of OSM XML elements, in a single pass."""
+        ids = []
+        lats = []
+        lons = []
+        way_ids = []
+        refs = []
+        way_lengths = []
+        way_tags = []
         bounds = None
-        for element in root:
+        for element in elements:
             if element.tag == 'node':
-                node_id = int(element.attrib['id'])
-                lat = float(element.attrib['lat'])
-                lon = float(element.attrib['lon'])
-                id_to_node[node_id] = Node(
-                    id=node_id, lon=np.radians(lon), lat=np.radians(lat), raw_lon=lon, raw_lat=lat)
-            if element.tag == 'bounds':
-                bounds = element.attrib
-        return id_to_node, bounds
+                ids.append(int(element.attrib['id']))
+                lats.append(float(element.attrib['lat']))
+                lons.append(float(element.attrib['lon']))
+            elif element.tag == 'way':
+                node_refs = [int(nd.attrib['ref']) for nd in element.findall('nd')]
+                refs.extend(node_refs)
+                way_lengths.append(len(node_refs))
+                way_ids.append(int(element.attrib['id']))
+                way_tags.append({tag.attrib['k']: tag.attrib['v'] for tag in element.findall('tag')})
+            elif element.tag == 'bounds':
+                bounds = dict(element.attrib)
+        ways = Ways(ids=np.array(way_ids, dtype=np.int64), refs=np.array(refs, dtype=np.int64),
+                    lengths=np.array(way_lengths, dtype=np.int64), tags=way_tags)
+        return OSMData(nodes=NodeStore(ids=ids, lat=lats, lon=lons), ways=ways, bounds=bounds)
+
+    @staticmethod
+    def read(filename: str, workers: int = 1) -> OSMData:
+        """
+        Reads .osm, .osm.gz, .osm.bz2, .osm.xz or .osm.pbf files. XML is
+        streamed (and decompressed) without building the whole tree; PBF
+        blocks are decoded by `workers` processes.
+        """
+        if filename.endswith('.pbf'):
+            import osm_pbf
+
+            data = osm_pbf.read(filename, workers=workers)
+            ways = Ways(ids=data.way_ids, refs=data.way_refs, lengths=data.way_lengths, tags=data.way_tags)
+            return OSMData(nodes=NodeStore(ids=data.node_ids, lat=data.node_lat, lon=data.node_lon),
+                           ways=ways, bounds=data.bounds)
+        with open_osm(filename) as f:
+            return OSMReader.collect(iter_elements(f))
+
+    @staticmethod
+    def parse_node(root) -> tp.Tuple[NodeStore, dict]:
+        data = OSMReader.collect(element for element in root if element.tag != 'way')
+        return data.nodes, data.bounds
 
     @staticmethod
-    def parse_edge(root, id_to_node: dict) -> tp.Tuple[list, list]:
-        edge_node_ids = []
-        edge_groups = []
-        for element in root:
-            if element.tag == 'way':
-                way_id = element.attrib['id']
-                node_refs = element.findall('nd')
-                node_ref0 = node_refs[0]
-                node_ref1 = node_refs[-1]
-                if node_ref0.attrib['ref'] == node_ref1.attrib['ref']:
-                    # self-loop node
-                    continue
-                edge_node_ids.extend([int(n.attrib['ref']) for n in node_refs])
-                is_oneway_edge = OSMReader.is_oneway_edge(element)
-                edges = []
-                for i in range(len(node_refs) - 1):
-                    nd0 = node_refs[i]
-                    nd1 = node_refs[i + 1]
-                    node0 = Node(
-                        id=int(nd0.attrib['ref']),
-                        lon=id_to_node[int(nd0.attrib['ref'])].lon,
-                        lat=id_to_node[int(nd0.attrib['ref'])].lat,
-                        raw_lon=id_to_node[int(nd0.attrib['ref'])].raw_lon,
-                        raw_lat=id_to_node[int(nd0.attrib['ref'])].raw_lat,
-                    )
-                    node1 = Node(
-                        id=int(nd1.attrib['ref']),
-                        lon=id_to_node[int(nd1.attrib['ref'])].lon,
-                        lat=id_to_node[int(nd1.attrib['ref'])].lat,
-                        raw_lon=id_to_node[int(nd1.attrib['ref'])].raw_lon,
-                        raw_lat=id_to_node[int(nd1.attrib['ref'])].raw_lat,
-                    )
-                    edge = Edge(id=way_id, name='', nodes=(node0, node1), is_oneway=is_oneway_edge)
-                    edges.append(edge)
-                edge_groups.append(EdgeGroup(edges=edges))
-
-        return edge_node_ids, edge_groups
+    def parse_edge(root, nodes: NodeStore) -> tp.Tuple[np.ndarray, WaySegments]:
+        data = OSMReader.collect(element for element in root if element.tag == 'way')
+        return OSMReader.split_ways(data.ways, nodes)
 
     @staticmethod
-    def clean(edge_node_ids: list, edge_groups: list) -> tp.Tuple[tp.List[Edge], dict]:
-        clean_edges = []
-        id_to_node_index = {}
-        for edge_group in edge_groups:
-            edge_merge_queue = []
-            for edge in edge_group.edges:
-                edge_nodes = edge.nodes
-                if edge_node_ids.count(edge_nodes[0].id) < 2:
-                    if not len(edge_merge_queue):
-                        # no connection with any edges -> isolated component
-                        continue
-                if edge_node_ids.count(edge_nodes[1].id) > 1:
-                    if len(edge_merge_queue):
-                        new_edge = EdgeGroup.merge_edges([*edge_merge_queue, edge])
-                    else:
-                        new_edge = edge
-                    for node in new_edge.nodes:
-                        if node.id not in id_to_node_index:
-                            id_to_node_index[node.id] = len(id_to_node_index)
-                    clean_edges.append(new_edge)
-                    edge_merge_queue.clear()
+    def split_ways(ways: Ways, nodes: NodeStore) -> tp.Tuple[np.ndarray, WaySegments]:
+        """
+        Returns how often every node is referenced by the (non self-loop) ways
+        and the segments of those ways.
+        """
+        routable = ways.is_routable()
+        refs = ways.refs[np.repeat(routable, ways.lengths)]
+        ref_indices = nodes.find(refs)
+        if np.any(ref_indices < 0):
+            raise KeyError(int(refs[ref_indices < 0][0]))
+        ref_way_indices = np.repeat(np.arange(int(routable.sum())), ways.lengths[routable])
+        # a segment joins two consecutive refs of the same way
+        same_way = ref_way_indices[:-1] == ref_way_indices[1:]
+        segments = WaySegments(
+            node_indices=np.column_stack((ref_indices[:-1][same_way], ref_indices[1:][same_way])),
+            way_indices=ref_way_indices[:-1][same_way],
+            way_ids=ways.ids[routable],
+            way_is_oneway=ways.is_oneway()[routable],
+            way_tags=[tags for tags, keep in zip(ways.tags, routable.tolist()) if keep])
+        ref_counts = np.bincount(ref_indices, minlength=len(nodes))
+        return ref_counts, segments
+
+    @staticmethod
+    def clean(ref_counts: np.ndarray, segments: WaySegments, nodes: NodeStore) -> EdgeStore:
+        """
+        Drops dangling segments and merges chains of segments through nodes no
+        other way uses into single edges, whose length is the sum of the chain.
+        """
+        segment_lengths = haversine(
+            nodes.lat[segments.node_indices[:, 0]], nodes.lon[segments.node_indices[:, 0]],
+            nodes.lat[segments.node_indices[:, 1]], nodes.lon[segments.node_indices[:, 1]])
+        is_shared = (ref_counts > 1).tolist()
+        node_indices = []
+        lengths = []
+        is_merged = []
+        way_indices = []
+        queue_start = None
+        queue_length = 0.
+        previous_way = None
+        for segment, (node0, node1), way_index, length in zip(
+                range(len(segment_lengths)), segments.node_indices.tolist(),
+                segments.way_indices.tolist(), segment_lengths.tolist()):
+            if way_index != previous_way:
+                queue_start = None
+                previous_way = way_index
+            if not is_shared[node0] and queue_start is None:
+                # no connection with any edges -> isolated component
+                continue
+            if is_shared[node1]:
+                if queue_start is None:
+                    node_indices.append((node0, node1))
+                    lengths.append(length)
+                    is_merged.append(False)
                 else:
-                    edge_merge_queue.append(edge)
-        return clean_edges, id_to_node_index
+                    node_indices.append((queue_start, node1))
+                    lengths.append(queue_length + length)
+                    is_merged.append(True)
+                way_indices.append(way_index)
+                queue_start = None
+            else:
+                if queue_start is None:
+                    queue_start = node0
+                    queue_length = 0.
+                queue_length += length
+        return EdgeStore(
+            nodes=nodes, node_indices=np.array(node_indices, dtype=np.int64).reshape(-1, 2),
+            lengths=lengths, is_merged=is_merged, way_indices=way_indices,
+            way_ids=segments.way_ids, way_is_oneway=segments.way_is_oneway, way_tags=segments.way_tags)
 
     @staticmethod
-    def parse(filename: str):
-        tree = ElementTree.parse(filename)
-        root = tree.getroot()
-        id_to_node, bounds = OSMReader.parse_node(root)
-        edge_node_ids, edge_groups = OSMReader.parse_edge(root, id_to_node)
-        clean_edges, id_to_node_index = OSMReader.clean(edge_node_ids, edge_groups)
-        num_node = len(id_to_node_index)
-        adjacency_matrix = np.zeros((num_node, num_node))
-        for edge in clean_edges:
-            nodes = edge.nodes
-            node0_id = nodes[0].id
-            node1_id = nodes[1].id
-            node0_idx = id_to_node_index[node0_id]
-            node1_idx = id_to_node_index[node1_id]
-            weight = edge.distance() if edge.merged_length is None else edge.merged_length
-            adjacency_matrix[node0_idx, node1_idx] = weight
-            if not edge.is_oneway:
-                adjacency_matrix[node1_idx, node0_idx] = weight
-
-        # re-correct adjacency matrix for case of more than one CC in the graph
-        G = nx.from_numpy_array(adjacency_matrix, create_using=nx.DiGraph)
-        # Find all strongly connected components
-        weakly_connected_components = list(nx.strongly_connected_components(G))
-        largest_cc = max(weakly_connected_components, key=len)
-        for component in weakly_connected_components:
-            if component != largest_cc:
-                adjacency_matrix[:, list(component)] = 0.
-                adjacency_matrix[list(component), :] = 0.
-        clean_clean_edges = []
-        removed_node_indices = []
-        for edge in clean_edges:
-            node_idx_1 = id_to_node_index[edge.nodes[0].id]
-            node_idx_2 = id_to_node_index[edge.nodes[1].id]
-            if node_idx_1 not in largest_cc:
-                removed_node_indices.append(node_idx_1)
-            if node_idx_2 not in largest_cc:
-                removed_node_indices.append(node_idx_2)
-            if node_idx_1 in largest_cc and node_idx_2 in largest_cc:
-                clean_clean_edges.append(edge)
-        index_to_node = [id_to_node[_id] for _id, idx in id_to_node_index.items()
-                         if idx not in removed_node_indices]
-        adjacency_matrix = np.delete(adjacency_matrix, removed_node_indices, axis=0)
-        adjacency_matrix = np.delete(adjacency_matrix, removed_node_indices, axis=1)
-        return OSMReader(
-            index_to_node=index_to_node, edges=clean_clean_edges,
-            adjacency_matrix=adjacency_matrix, bounds=bounds)
+    def parse(filename: str, workers: int = 1):
+        import scipy.sparse as sparse
+        import scipy.sparse.csgraph as csgraph
+
+        nodes, ways, bounds = OSMReader.read(filename, workers=workers)
+        if bounds is None:
+            bounds = {'minlat': nodes.raw_lat.min(), 'minlon': nodes.raw_lon.min(),
+                      'maxlat': nodes.raw_lat.max(), 'maxlon': nodes.raw_lon.max()}
+        ref_counts, segments = OSMReader.split_ways(ways, nodes)
+        del ways
+        edges = OSMReader.clean(ref_counts, segments, nodes)
+        # graph nodes are numbered in order of first use by an edge
+        flat_indices = edges.node_indices.ravel()
+        used, first_use = np.unique(flat_indices, return_index=True)
+        used = used[np.argsort(first_use)]
+        node_index_map = np.full(len(nodes), -1, dtype=np.int64)
+        node_index_map[used] = np.arange(len(used))
+        edge_node_indices = node_index_map[edges.node_indices]
+
+        # keep the largest strongly connected component only
+        is_oneway = edges.is_oneway
+        sources = np.concatenate((edge_node_indices[:, 0], edge_node_indices[~is_oneway, 1]))
+        targets = np.concatenate((edge_node_indices[:, 1], edge_node_indices[~is_oneway, 0]))
+        graph = sparse.coo_matrix(
+            (np.ones(len(sources)), (sources, targets)), shape=(len(used), len(used))).tocsr()
+        _, labels = csgraph.connected_components(graph, directed=True, connection='strong')
+        largest_cc = np.argmax(np.bincount(labels))
+        kept_nodes = labels == largest_cc
+        kept_edges = np.flatnonzero(kept_nodes[edge_node_indices].all(axis=1))
+        # the kept node order follows the graph node numbering
+        index_to_node = nodes.take(used[kept_nodes])
+        kept_index_map = np.full(len(nodes), -1, dtype=np.int64)
+        kept_index_map[used[kept_nodes]] = np.arange(int(kept_nodes.sum()))
+        clean_edges = edges.take(kept_edges, index_to_node, kept_index_map)
+        return OSMReader(index_to_node=index_to_node, edges=clean_edges, bounds=bounds)
 
     def get_line_coordinates(self, return_colors=False) \
             -> tp.Union[np.ndarray, tp.Tuple[np.ndarray, dict]]:
-        line_node_coordinates = []
-        line_index_to_color = {}
-        for idx, edge in enumerate(self.edges):
-            temp = []
-            for node in edge.nodes:
-                temp.append(list(node.to_cartesian())[:-1])
-            line_node_coordinates.append(temp)
-            if edge.is_oneway:
-                line_index_to_color[idx] = (0, 0, 0)
+        node_coordinates = self.get_node_coordinates()
+        line_node_coordinates = node_coordinates[self.edges.node_indices].reshape(-1, 2, 2)
         if return_colors:
-            return np.array(line_node_coordinates), line_index_to_color
-        return np.array(line_node_coordinates)
+            line_index_to_color = {idx: (0, 0, 0) for idx in np.flatnonzero(self.edges.is_oneway).tolist()}
+            return line_node_coordinates, line_index_to_color
+        return line_node_coordinates
 
     def get_node_coordinates(self) -> np.ndarray:
-        node_coordinates = []
-        for node in self.index_to_node:
-            node_coordinates.append(list(node.to_cartesian())[:-1])
-        return np.array(node_coordinates)
+        return self.index_to_node.get_cartesian_coordinates()
 
     def get_array_bounds(self):
         return [[float(self.bounds['minlat']), float(self.bounds['minlon'])],
                 [float(self.bounds['maxlat']), float(self.bounds['maxlon'])]]
 
-    def convert_adjacency_matrix_to_dict(self) -> dict:
-        adjacency_matrix = self.adjacency_matrix
-        graph = {}
-
-        for i in range(len(self.index_to_node)):
-            vertex = i
-            neighbors = []
-
-            for j in range(len(adjacency_matrix[i])):
-                weight = adjacency_matrix[i][j]
-
-                if weight != 0:
-                    neighbor = j
-                    neighbors.append((neighbor, weight))
-
-            # assert len(neighbors) > 0 # directed graph ???
-            graph[vertex] = neighbors
-
+    def convert_adjacency_matrix_to_dict(self, profile: tp.Union[str, None] = None) -> dict:
+        weights = self.profile_weights[profile or self.profile]
+        finite = np.flatnonzero(np.isfinite(weights))
+        # neighbours by ascending index, the lightest of parallel arcs only
+        finite = finite[np.lexsort((weights[finite], self.arc_targets[finite], self.arc_sources[finite]))]
+        sources = self.arc_sources[finite]
+        targets = self.arc_targets[finite]
+        first = np.ones(len(finite), dtype=bool)
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        graph = {vertex: [] for vertex in range(len(self.index_to_node))}
+        for source, target, weight in zip(sources[first].tolist(), targets[first].tolist(),
+                                          weights[finite][first].tolist()):
+            graph[source].append((target, weight))
         return graph
 
     def get_coordinates_from_node_indices(self, node_indices: tp.Union[list, np.ndarray]):
-        coordinates = []
-        for node_index in node_indices:
-            node = self.index_to_node[node_index]
-            coordinates.append([node.raw_lat, node.raw_lon])
-        return coordinates
+        node_indices = np.asarray(node_indices, dtype=np.int64)
+        return np.column_stack((self.index_to_node.raw_lat[node_indices],
+                                self.index_to_node.raw_lon[node_indices])).tolist()
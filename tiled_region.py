@@ -0,0 +1,227 @@
+import os
+import sys
+import typing as tp
+import numpy as np
+import dijkstra
+import process_map_data as pmd
+
+from xml.etree import ElementTree
+
+__all__ = ['TiledRegion']
+
+
+class Tile(tp.NamedTuple):
+    filename: str
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+
+    @staticmethod
+    def read(filename: str):
+        # only the header is read, the bounds precede all nodes
+        bounds = None
+        if filename.endswith('.pbf'):
+            import osm_pbf
+            bounds = osm_pbf.read_bounds(filename)
+        else:
+            with pmd.open_osm(filename) as f:
+                for _, element in ElementTree.iterparse(f, events=('start',)):
+                    if element.tag == 'bounds':
+                        bounds = element.attrib
+                        break
+                    if element.tag in ('node', 'way', 'relation'):
+                        break
+        if bounds is None:
+            raise ValueError(f'{filename} has no bounds')
+        return Tile(
+            filename=filename,
+            min_lat=float(bounds['minlat']), min_lon=float(bounds['minlon']),
+            max_lat=float(bounds['maxlat']), max_lon=float(bounds['maxlon']))
+
+
+class TiledRegion:
+    """
+    A region made of adjacent OSM extracts. Tiles are indexed by their bounds
+    and parsed only when needed: by a coordinate lookup, or when a search
+    expands a node lying inside a tile that is not loaded yet. Nodes shared by
+    ways of adjacent tiles have the same OSM id, so tiles are stitched simply
+    by keying the graph on OSM node ids.
+
+    Extracts may be clipped to their bounds: a way crossing the border then
+    lists all of its refs, but only the nodes inside the tile. The crossing
+    segment is kept pending on its known end and added once a tile providing
+    the other end is loaded. Expanding a node with pending segments loads the
+    tiles adjacent to its own, so segments must not be longer than a tile.
+
+    The region behaves like the adjacency dict the search functions take
+    (`get(node_id)` returns [(neighbor_id, weight), ...]), so e.g.
+    `dijkstra.dijkstra(region, start, end)` loads tiles as its frontier
+    reaches them.
+    """
+
+    def __init__(self, tiles: tp.List[Tile]):
+        assert len(tiles), 'Region has no tiles'
+        self.tiles = tiles
+        self._tile_bounds = np.array(
+            [[tile.min_lat, tile.min_lon, tile.max_lat, tile.max_lon] for tile in tiles])
+        self._loaded_tiles = set()
+        self._adjacency = {}  # node id -> {neighbor id: weight}
+        self.id_to_node = {}
+        self._checked_node_ids = set()
+        self._tile_spatial_indices = {}
+        self._pending_segments = {}  # missing node id -> [(node id 0, node id 1, is oneway), ...]
+        self._unresolved = {}  # known node id -> missing node ids of its pending segments
+
+    @staticmethod
+    def from_directory(directory: str):
+        filenames = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                           if name.endswith(pmd.OSM_EXTENSIONS))
+        return TiledRegion([Tile.read(filename) for filename in filenames])
+
+    @property
+    def loaded_tiles(self) -> tp.List[Tile]:
+        return [self.tiles[index] for index in sorted(self._loaded_tiles)]
+
+    def tile_indices_at(self, lat: float, lon: float) -> np.ndarray:
+        bounds = self._tile_bounds
+        inside = ((bounds[:, 0] <= lat) & (lat <= bounds[:, 2])
+                  & (bounds[:, 1] <= lon) & (lon <= bounds[:, 3]))
+        return np.flatnonzero(inside)
+
+    def tile_indices_near(self, lat: float, lon: float) -> np.ndarray:
+        """Tiles containing the location, or the closest tile when none does."""
+        tile_indices = self.tile_indices_at(lat, lon)
+        if not len(tile_indices):
+            # ways of an extract reach past its bounds
+            bounds = self._tile_bounds
+            lat_gap = np.maximum(np.maximum(bounds[:, 0] - lat, lat - bounds[:, 2]), 0.)
+            lon_gap = np.maximum(np.maximum(bounds[:, 1] - lon, lon - bounds[:, 3]), 0.)
+            tile_indices = np.array([np.argmin(np.hypot(lat_gap, lon_gap))])
+        return tile_indices
+
+    def tile_indices_adjacent(self, tile_indices: np.ndarray) -> np.ndarray:
+        """Tiles whose bounds touch or overlap those of `tile_indices`, excluding them."""
+        bounds = self._tile_bounds
+        adjacent = np.zeros(len(bounds), dtype=bool)
+        for tile_index in tile_indices:
+            min_lat, min_lon, max_lat, max_lon = bounds[tile_index]
+            adjacent |= ((bounds[:, 0] <= max_lat + 1e-9) & (bounds[:, 2] >= min_lat - 1e-9)
+                         & (bounds[:, 1] <= max_lon + 1e-9) & (bounds[:, 3] >= min_lon - 1e-9))
+        adjacent[tile_indices] = False
+        return np.flatnonzero(adjacent)
+
+    def _add_segment(self, node_id0: int, node_id1: int, is_oneway: bool):
+        node0 = self.id_to_node[node_id0]
+        node1 = self.id_to_node[node_id1]
+        weight = float(pmd.haversine(node0.lat, node0.lon, node1.lat, node1.lon))
+        self._adjacency.setdefault(node_id0, {})[node_id1] = weight
+        self._adjacency.setdefault(node_id1, {})
+        if not is_oneway:
+            self._adjacency[node_id1][node_id0] = weight
+
+    def load_tile(self, tile_index: int):
+        if tile_index in self._loaded_tiles:
+            return
+        self._loaded_tiles.add(tile_index)
+        nodes, ways, _ = pmd.OSMReader.read(self.tiles[tile_index].filename)
+        ref_way_indices = ways.ref_way_indices()
+        node_indices = nodes.find(ways.refs)
+        segment_way_indices = ref_way_indices[:-1]
+        is_segment = ((segment_way_indices == ref_way_indices[1:]) & ways.is_routable()[segment_way_indices]
+                      & ((node_indices[:-1] >= 0) | (node_indices[1:] >= 0)))
+        indices0 = node_indices[:-1][is_segment]
+        indices1 = node_indices[1:][is_segment]
+        node_ids0 = ways.refs[:-1][is_segment].tolist()
+        node_ids1 = ways.refs[1:][is_segment].tolist()
+        is_oneway = ways.is_oneway()[segment_way_indices[is_segment]].tolist()
+        tile_node_ids = set()
+        for index in np.unique(np.concatenate((indices0, indices1))).tolist():
+            if index < 0:
+                continue
+            node_id = int(nodes.ids[index])
+            if node_id not in self.id_to_node:
+                self.id_to_node[node_id] = nodes[index]
+            self._adjacency.setdefault(node_id, {})
+            tile_node_ids.add(node_id)
+        for index0, index1, node_id0, node_id1, oneway in zip(
+                indices0.tolist(), indices1.tolist(), node_ids0, node_ids1, is_oneway):
+            if index0 >= 0 and index1 >= 0:
+                self._add_segment(node_id0, node_id1, oneway)
+                continue
+            # clipped by the tile border, the other end lies in another tile
+            known_id, missing_id = (node_id0, node_id1) if index0 >= 0 else (node_id1, node_id0)
+            if missing_id in self.id_to_node:
+                self._add_segment(node_id0, node_id1, oneway)
+                continue
+            self._pending_segments.setdefault(missing_id, []).append((node_id0, node_id1, oneway))
+            self._unresolved.setdefault(known_id, set()).add(missing_id)
+        # segments of loaded tiles waiting for a node of this one
+        for node_id in tile_node_ids & self._pending_segments.keys():
+            for node_id0, node_id1, oneway in self._pending_segments.pop(node_id):
+                self._add_segment(node_id0, node_id1, oneway)
+                known_id = node_id1 if node_id0 == node_id else node_id0
+                self._unresolved[known_id].discard(node_id)
+        tile_node_ids = list(tile_node_ids)
+        self._tile_spatial_indices[tile_index] = (tile_node_ids, pmd.SpatialIndex(
+            node_lat=[self.id_to_node[node_id].lat for node_id in tile_node_ids],
+            node_lon=[self.id_to_node[node_id].lon for node_id in tile_node_ids],
+            edge_node_indices=np.empty((0, 2), dtype=np.int64)))
+
+    def activate(self, node_id: int):
+        """Loads every tile the node lies in, so all of its edges are known."""
+        if node_id in self._checked_node_ids:
+            return
+        self._checked_node_ids.add(node_id)
+        node = self.id_to_node[node_id]
+        tile_indices = self.tile_indices_near(node.raw_lat, node.raw_lon)
+        for tile_index in tile_indices:
+            self.load_tile(int(tile_index))
+        if self._unresolved.get(node_id):
+            for tile_index in self.tile_indices_adjacent(tile_indices):
+                self.load_tile(int(tile_index))
+
+    def get(self, node_id: int, default=()):
+        if node_id not in self.id_to_node:
+            return default
+        self.activate(node_id)
+        return list(self._adjacency[node_id].items())
+
+    def __len__(self):
+        return len(self._adjacency)
+
+    def nearest_node(self, lat: float, lon: float) -> int:
+        tile_indices = self.tile_indices_near(lat, lon)
+        best_node_id = None
+        best_distance = np.inf
+        for tile_index in tile_indices:
+            self.load_tile(int(tile_index))
+            node_ids, spatial_index = self._tile_spatial_indices[int(tile_index)]
+            if not node_ids:
+                continue
+            indices, distances = spatial_index.nearest_nodes(lat, lon)
+            if distances[0] < best_distance:
+                best_node_id = node_ids[indices[0]]
+                best_distance = distances[0]
+        assert best_node_id is not None, 'No road near the location'
+        return best_node_id
+
+    def shortest_path(self, start: tp.Sequence[float], end: tp.Sequence[float],
+                      progress=None) -> tp.Tuple[float, list]:
+        """Dijkstra between two (lat, lon) locations, snapped to their nearest nodes."""
+        start_id = self.nearest_node(*start)
+        end_id = self.nearest_node(*end)
+        return dijkstra.dijkstra(self, start_id, end_id, progress=progress)
+
+    def get_coordinates_from_node_ids(self, node_ids: tp.Iterable[int]):
+        return [[self.id_to_node[node_id].raw_lat, self.id_to_node[node_id].raw_lon]
+                for node_id in node_ids]
+
+
+if __name__ == '__main__':
+    region = TiledRegion.from_directory(sys.argv[1] if len(sys.argv) > 1 else 'data')
+    print("Number of tiles: ", len(region.tiles))
+    distance, path = region.shortest_path(start=(10.7874841, 106.6915718), end=(10.7890472, 106.6972026))
+    print("Loaded tiles: ", len(region.loaded_tiles))
+    print("Distance: ", distance)
+    print("Path: ", region.get_coordinates_from_node_ids(path))
@@ -1,8 +1,4 @@
-import numpy as np
-import shortestpaths as sp
-import networkx as nx
 import dijkstra
-import process_map_data as pmd
 
 
 def remove_edges_from_graph(graph, start, end_nodes):
@@ -37,7 +33,7 @@ def get_cost_from_path(graph, path):
     return cost
 
 
-def yen(graph, source, target, top=3):
+def yen(graph, source, target, top=3, progress=None):
     """
     Finds k shortest loopless paths from source to target in a graph,
     including their costs.
@@ -48,6 +44,7 @@ def yen(graph, source, target, top=3):
         source: The starting node.
         target: The destination node.
         top: The number of shortest paths to find.
+        progress: Optional callable receiving (done, total) spur searches.
 
     Returns:
         A list of tuples containing (cost, path) for k shortest paths.
@@ -57,7 +54,10 @@ def yen(graph, source, target, top=3):
     candidate_path_to_cost = {}
 
     for k in range(top - 1):
-        for i, node in enumerate(shortest_paths[k][0][:-1]):
+        spur_nodes = shortest_paths[k][0][:-1]
+        for i, node in enumerate(spur_nodes):
+            if progress is not None:
+                progress(k * len(spur_nodes) + i, (top - 1) * len(spur_nodes))
             spur_node = node
             root_path = shortest_paths[k][0][:i]
             removed_nodes = get_removed_share_same_root_nodes_from_paths(
@@ -83,6 +83,12 @@ def yen(graph, source, target, top=3):
 
 
 if __name__ == '__main__':
+    # reference implementations, only needed for this self-test
+    import numpy as np
+    import shortestpaths as sp
+    import networkx as nx
+    import process_map_data as pmd
+
     # # Example usage
     # Graph = {
     #     "C": [('D', 3), ('E', 2)],